@@ -0,0 +1,240 @@
+"""
+End-to-end benchmark of the dashboard pipeline on synthetic cohorts.
+
+Each stage of the pipeline (ingestion, monitoring preparation, plots, correction,
+reports) is timed on synthetic event logs and quiz banks, for every combination of
+cohort size and number of quizzes. Results are written as JSON, and can be compared
+to a previous run to detect regressions. The memory held by the ingested event log
+is reported per event, next to the same log in the layout of readData.
+
+    python benchmarks/bench_pipeline.py                           # 50/500/5000 students x 20/100 quizzes
+    python benchmarks/bench_pipeline.py -s 50 -q 20 -o bench.json
+    python benchmarks/bench_pipeline.py -s 50 -q 20 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+sys.path.insert(0, str(HERE.parent / "src" / "quiz_dash"))
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import synthetic
+import quiz_dash as qd
+from ingest import IncrementalEventLog, memory_report, parse_timestamps
+from labquiz.main import QuizLab
+from labquiz.putils import correctQuizzesDf
+from scoring import correct_quizzes, ClassCorrection
+
+
+WEIGHTS = {(True, True): 1.0, (True, False): -1.0, (False, True): 0.0, (False, False): 0.0}
+PLOT_TYPES = ["student_counts", "student_scores", "class_results", "quizzes_selectivity"]
+
+
+class FrameSource:
+    """In-memory source returning a fixed CSV text."""
+    key = "benchmark"
+
+    def __init__(self, text):
+        self.text = text
+
+    def fetch(self):
+        return self.text
+
+
+def timed(stages, name, func, items=1, repeat=1):
+    """Runs func `repeat` times, records the best time in stages[name], returns the last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - tic)
+    stages[name] = {"seconds": round(best, 6), "items": items, "per_item": round(best / max(items, 1), 6)}
+    print(f"    {name:<32} {best:9.3f} s  ({items} item(s))", flush=True)
+    return result
+
+
+def has_weasyprint():
+    try:
+        import weasyprint  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+def run_case(n_students, n_quizzes, args):
+    print(f"== {n_students} students x {n_quizzes} quizzes", flush=True)
+    bank = synthetic.make_quiz_bank(n_quizzes, seed=args.seed)
+    full_df, full_df_filt = synthetic.make_events(bank, n_students, seed=args.seed)
+    raw_csv = synthetic.to_raw_csv(full_df)
+    # Timestamps parsed as when the events enter the dashboard
+    full_df, full_df_filt = parse_timestamps(full_df), parse_timestamps(full_df_filt.copy())
+    stages = {}
+    rep = args.repeat
+
+    # Ingestion (cold read of the whole sheet, then an idle refresh)
+    log = IncrementalEventLog(FrameSource(raw_csv))
+    timed(stages, "ingest_cold", lambda: log.update(raw_csv), items=len(full_df))
+    timed(stages, "ingest_idle", lambda: log.update(raw_csv), items=len(full_df), repeat=rep)
+    memory = memory_report(log.df)
+    print(f"    {'memory (bytes/event)':<32} {memory['bytes_per_event']:9.1f}    "
+          f"(readData layout: {memory['loose_bytes_per_event']:.1f}, x{memory['ratio']})", flush=True)
+
+    quiz = QuizLab("", synthetic.quiz_bank_file(bank), needAuthentification=False, mandatoryInternet=False,
+                   in_streamlit=True, silentStart=True, **synthetic.PARAMETERS)
+
+    # Monitoring
+    df = timed(stages, "generate_cols_from_student", lambda: qd.generate_cols_from_student(full_df),
+               items=len(full_df), repeat=rep)
+    df_filt = qd.generate_cols_from_student(full_df_filt)
+    df_last = timed(stages, "prepare_monitoring_data", lambda: qd.prepare_monitoring_data(df),
+                    items=len(df), repeat=rep)
+    quiz_stats_all = df_last.groupby("quiz_title")["score"].agg(["mean", "std"]).reset_index()
+    timelines = timed(stages, "student_timelines", lambda: qd.student_timelines(df_last, quiz_stats_all),
+                      items=len(df_last), repeat=rep)
+    timed(stages, "plot_student_session_track",
+          lambda: [qd.plot_student_session_track(data, student, timeline=layout)
+                   for student, (data, layout) in list(timelines.items())[:args.report_limit]],
+          items=min(len(timelines), args.report_limit))
+    for plot_type in PLOT_TYPES:
+        timed(stages, f"create_monitoring_plot[{plot_type}]",
+              lambda: qd.create_monitoring_plot(df_last, plot_type, plot_type), items=len(df_last), repeat=rep)
+
+    # Correction (labquiz reference implementation, on a sample of students for large cohorts)
+    students = sorted(full_df_filt["student"].unique())
+    sample = students[:args.correct_limit]
+    data = full_df[full_df["student"].isin(sample)]
+    data_filt = full_df_filt[full_df_filt["student"].isin(sample)]
+    res = timed(stages, "correctQuizzesDf",
+                lambda: correctQuizzesDf(data=data, data_filt=data_filt, quiz=quiz, seuil=0,
+                                         weights=WEIGHTS, maxtries=3),
+                items=len(sample))
+    res_vec = timed(stages, "correct_quizzes",
+                    lambda: correct_quizzes(data, data_filt, quiz, seuil=0, weights=WEIGHTS, maxtries=3),
+                    items=len(sample), repeat=rep)
+    if not res_vec.equals(res):
+        print("    WARNING: correct_quizzes differs from correctQuizzesDf")
+    timed(stages, "correct_quizzes[all]",
+          lambda: correct_quizzes(full_df, full_df_filt, quiz, seuil=0, weights=WEIGHTS, maxtries=3),
+          items=len(students))
+    correction = ClassCorrection(full_df, full_df_filt, quiz, maxtries=3)
+    new_weights = {(True, True): 1.0, (True, False): -0.5, (False, True): -0.25, (False, False): 0.25}
+    timed(stages, "regrade[weights]", lambda: correction.grade(new_weights), items=len(students), repeat=rep)
+    res = res.reset_index().rename(columns={"index": "student"})
+    res = qd.generate_cols_from_student(res, dropStudent=True)
+    res = res.drop(columns=["Note", "maxpts"], errors="ignore")
+    questions = [c for c in res.columns if c not in ["student", "maxpts", "Note", "FinalMark",
+                                                     "name", "firstname", "class_group"]]
+    adj_bareme = pd.DataFrame({"AvgScore": res[questions].mean(axis=0),
+                               "Coefficient": [1.0] * len(questions)}).transpose()
+    df_final = timed(stages, "recompute_score",
+                     lambda: qd.recompute_score(adj_bareme, questions, "", res, data, data_filt, quiz,
+                                                0, WEIGHTS, 3),
+                     items=len(res), repeat=rep)
+
+    # Reports
+    st.session_state.df_final = df_final
+    st.session_state.scale = adj_bareme
+    st.session_state.FinalMarkScale = "20"
+    st.session_state.TrueFinalMarkScale = "20"
+    df_last_filt = qd.prepare_monitoring_data(df_filt[df_filt["student"].isin(sample)])
+    quiz_stats = df_last_filt.groupby("quiz_title")["score"].agg(["mean", "std"]).reset_index()
+    marks_df = df_final.copy()
+    marks_df["full_names"] = marks_df["name"] + " " + marks_df["firstname"]
+    all_students = sorted(marks_df["full_names"].unique())
+    report_sample = all_students[:args.report_limit]
+
+    def student_reports(pdf=False):
+        out = None
+        for student in report_sample:
+            student_data = qd.prepare_student_data(df_last_filt, marks_df, quiz_stats, student)
+            out = qd.make_individual_report(student, df_last_filt, student_data, quiz, WEIGHTS, adj_bareme)
+            if pdf:
+                out = qd.generate_pdf_report(out)
+        return out
+
+    timed(stages, "prepare_student_data",
+          lambda: [qd.prepare_student_data(df_last_filt, marks_df, quiz_stats, s) for s in report_sample],
+          items=len(report_sample))
+    html = timed(stages, "make_individual_report", student_reports, items=len(report_sample))
+    zip_students = all_students[:args.zip_limit]
+    timed(stages, "generate_zip_report[html]",
+          lambda: qd.generate_zip_report(zip_students, df_last_filt, marks_df, quiz_stats, quiz, WEIGHTS,
+                                         True, pdf_output=False),
+          items=len(zip_students))
+    if has_weasyprint() and not args.no_pdf:
+        timed(stages, "generate_pdf_report", lambda: qd.generate_pdf_report(html), items=1)
+        timed(stages, "generate_zip_report[pdf]",
+              lambda: qd.generate_zip_report(zip_students, df_last_filt, marks_df, quiz_stats, quiz, WEIGHTS,
+                                             True, pdf_output=True),
+              items=len(zip_students))
+    else:
+        print("    PDF stages skipped (weasyprint unavailable or --no-pdf)")
+
+    return {"students": n_students, "quizzes": n_quizzes, "events": len(full_df),
+            "corrected_students": len(sample), "memory": memory, "stages": stages}
+
+
+def compare(results, reference_file, tolerance):
+    """Prints the stages slower than the reference by more than `tolerance`. Returns their number."""
+    reference = json.loads(Path(reference_file).read_text())
+    ref_cases = {(r["students"], r["quizzes"]): r["stages"] for r in reference["results"]}
+    regressions = 0
+    for case in results:
+        ref = ref_cases.get((case["students"], case["quizzes"]), {})
+        for name, stage in case["stages"].items():
+            if name not in ref or ref[name]["per_item"] == 0:
+                continue
+            ratio = stage["per_item"] / ref[name]["per_item"]
+            if ratio > 1 + tolerance:
+                regressions += 1
+                print(f"REGRESSION {case['students']}x{case['quizzes']} {name}: x{ratio:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-s", "--students", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("-q", "--quizzes", type=int, nargs="+", default=[20, 100])
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="repetitions of the fast stages (best kept)")
+    parser.add_argument("--correct-limit", type=int, default=500, help="students corrected by correctQuizzesDf")
+    parser.add_argument("--report-limit", type=int, default=5, help="students for the individual report stages")
+    parser.add_argument("--zip-limit", type=int, default=20, help="students in the zip report stages")
+    parser.add_argument("--no-pdf", action="store_true", help="skip the PDF rendering stages")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="JSON report file (default: stdout)")
+    parser.add_argument("--compare", help="previous JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    results = [run_case(n_s, n_q, args) for n_s in args.students for n_q in args.quizzes]
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
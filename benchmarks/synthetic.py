@@ -0,0 +1,107 @@
+"""
+Synthetic LabQuiz cohorts: quiz YAML banks and event logs shaped like the
+output of labquiz.putils.readData, for benchmarking the dashboard pipeline.
+"""
+import io
+import json
+
+import numpy as np
+import pandas as pd
+from ruamel.yaml import YAML
+
+
+PARAMETERS = {'retries': 2, 'exam_mode': False, 'test_mode': False}
+N_GROUPS = 4
+
+
+def make_quiz_bank(n_quizzes, n_props=4, numeric_ratio=0.2, seed=0):
+    """Returns a quiz bank dict {quiz_id: entry} (mcq with constraints, and numeric quizzes)."""
+    rng = np.random.default_rng(seed)
+    bank = {}
+    for k in range(1, n_quizzes + 1):
+        quiz_id = f"quiz{k}"
+        labels = [chr(ord('a') + j) for j in range(n_props)]
+        if rng.random() < numeric_ratio:
+            bank[quiz_id] = {
+                "type": "numeric",
+                "question": f"Compute the value of **x{k}** (give $x_{k}$ with 2 decimals).",
+                "propositions": [
+                    {"label": lab, "proposition": f"Value of `{lab}`",
+                     "expected": float(np.round(rng.uniform(0, 10), 2)), "tolerance": 0.01}
+                    for lab in labels[:2]
+                ],
+            }
+        else:
+            expected = rng.random(n_props) < 0.5
+            expected[rng.integers(n_props)] = True  # At least one true statement (non zero max score)
+            bank[quiz_id] = {
+                "type": "mcq",
+                "question": f"Question {k}: which statements about *topic {k}* are **true**?",
+                "propositions": [
+                    {"label": lab, "proposition": f"Statement {lab} of quiz {k} with `code` and $x^{k}$",
+                     "expected": bool(exp)}
+                    for lab, exp in zip(labels, expected)
+                ],
+                "constraints": [{"indexes": [labels[0], labels[1]], "type": "XOR", "malus": 1}],
+            }
+    return bank
+
+
+def quiz_bank_file(bank, name="synthetic_quiz.yaml"):
+    """YAML file-like object, as given by the streamlit file uploader."""
+    buffer = io.StringIO()
+    YAML().dump(bank, buffer)
+    f = io.BytesIO(buffer.getvalue().encode("utf-8"))
+    f.name = name
+    f.size = len(f.getvalue())
+    return f
+
+
+def make_events(bank, n_students, answered_ratio=0.8, max_tries=3, correction_ratio=0.2,
+                anomaly_ratio=0.01, start="2025-01-10 08:00:00", duration_min=180, seed=0):
+    """
+    Returns an event log like readData's `df`: one 'starting' event per student, then
+    1..max_tries 'validate' events per answered quiz, sometimes followed by a 'correction'.
+    """
+    rng = np.random.default_rng(seed)
+    t0 = pd.Timestamp(start)
+    quiz_ids = list(bank)
+    rows = []
+    for s in range(n_students):
+        student = f"Name{s:05d}, First{s:05d}, G{s % N_GROUPS + 1}"
+        notebook = f"nb-{s:05d}"
+        rows.append((0.0, notebook, student, "starting", "starting", dict(PARAMETERS), {}, 0.0))
+        answered = [q for q in quiz_ids if rng.random() < answered_ratio]
+        times = np.sort(rng.uniform(1, duration_min, size=len(answered)))
+        for q, t in zip(answered, times):
+            params = dict(PARAMETERS)
+            if rng.random() < anomaly_ratio:
+                params['retries'] = 100
+            props = bank[q]["propositions"]
+            for attempt in range(rng.integers(1, max_tries + 1)):
+                if bank[q]["type"] == "numeric":
+                    answers = {p["label"]: float(p["expected"] + rng.choice([0, 0, 1])) for p in props}
+                    score = float(np.mean([a == p["expected"] for a, p in zip(answers.values(), props)]))
+                else:
+                    answers = {p["label"]: bool(rng.random() < 0.5) for p in props}
+                    score = float(np.mean([a == p["expected"] for a, p in zip(answers.values(), props)]))
+                rows.append((t + attempt * 0.5, notebook, student, q, "validate", params, answers, score))
+            if rng.random() < correction_ratio:
+                rows.append((t + max_tries, notebook, student, q, "correction", params, {}, 0.0))
+
+    df = pd.DataFrame(rows, columns=["minute", "notebook_id", "student", "quiz_title",
+                                     "event_type", "parameters", "answers", "score"])
+    stamps = t0 + pd.to_timedelta(df.pop("minute"), unit="min")
+    df.insert(0, "timestamp", stamps.dt.strftime("%Y-%m-%d %H:%M:%S") + " (Europe/Paris)")
+    df.insert(1, "send_timestamp", stamps.dt.strftime("%d/%m/%Y %H:%M:%S"))
+    df = df.sort_values("timestamp", kind="mergesort")
+    df_filt = df.query("event_type in ['validate', 'validate_exam', 'correction'] ")
+    return df, df_filt
+
+
+def to_raw_csv(df):
+    """CSV text as served by the sheet endpoint (answers and parameters JSON encoded)."""
+    raw = df.sort_index().copy()
+    raw["answers"] = raw["answers"].apply(json.dumps)
+    raw["parameters"] = raw["parameters"].apply(json.dumps)
+    return raw.to_csv(index=False)
@@ -0,0 +1,156 @@
+import sys
+import threading
+import time
+import weakref
+from collections import namedtuple
+
+import pandas as pd
+
+from memo import LRUCache, fingerprint
+
+
+# One evaluation of an artifact during a run: "computed" (with the reason) or "reused"
+Step = namedtuple("Step", ["artifact", "status", "reason", "seconds"])
+
+
+def token(value):
+    """Key of an input value: content hash for pandas objects, fingerprint of the repr otherwise."""
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        columns = list(value.columns) if isinstance(value, pd.DataFrame) else value.name
+        hashes = pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes()
+        return fingerprint(type(value).__name__, columns, hashes)
+    return fingerprint(value)
+
+
+def nbytes(value):
+    """
+    Memory held by an artifact (frames, series, and tuples, lists or dicts of them). Shallow:
+    objects in the columns are mostly shared with the events they were derived from.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=False))
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(nbytes(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+def reference(value):
+    """Weak reference to an input compared by identity (strong for objects without weak references)."""
+    try:
+        return weakref.ref(value)
+    except TypeError:
+        return lambda: value
+
+
+class Dataflow:
+    """
+    Memo of the artifacts derived from the events and the widgets (last attempts, statistics,
+    marks...), shared between the sessions. Each artifact declares its inputs, and is
+    recomputed only when one of them changed: a widget change only recomputes the artifacts
+    that depend on it. The inputs are values (data version, group, weights, scale...)
+    compared by content, or objects compared by identity when their name starts with '_'
+    (frames kept by the session), or other artifacts. The inputs compared by identity are
+    only weakly referenced: the memo does not keep former snapshots alive, and the
+    artifacts held are bounded to `maxbytes`.
+    """
+
+    def __init__(self, maxsize=64, maxbytes=None):
+        self.cache = LRUCache(maxsize=maxsize, sizeof=lambda entry: nbytes(entry[0]), maxbytes=maxbytes)
+        self._last = {}          # artifact -> input tokens of its last computation
+        self._lock = threading.Lock()
+
+    def run(self, artifacts, **inputs):
+        """
+        Evaluation for one rerun of the script. artifacts maps the name of each declared
+        artifact to (compute, names of its inputs); compute is called with the inputs in order.
+        """
+        return DataflowRun(self, artifacts, inputs)
+
+    def _changed(self, name, tokens):
+        # Inputs which differ from the last computation of the artifact (and records the new ones)
+        with self._lock:
+            last = self._last.get(name)
+            self._last[name] = tokens
+        if last is None:
+            return "first computation"
+        changed = [key for key, value in tokens.items() if last.get(key) != value]
+        return "changed: " + ", ".join(changed) if changed else "no longer cached"
+
+
+class DataflowRun:
+    """
+    Artifacts of one rerun: each one is evaluated at most once per run, reused from the
+    dataflow memo when its inputs did not change. The steps log what was recomputed and why.
+    The artifacts are shared and must not be modified in place.
+    """
+
+    def __init__(self, flow, artifacts, inputs):
+        self.flow = flow
+        self.artifacts = artifacts
+        self.inputs = dict(inputs)
+        self.values = {}         # artifact -> (value, key)
+        self.steps = []
+
+    def set(self, **inputs):
+        """Inputs known later in the script (e.g. once a widget is shown)."""
+        for key in inputs:
+            if key in self.artifacts or key in self.values:
+                raise ValueError(f"Input {key} has the name of an artifact")
+        self.inputs.update(inputs)
+
+    def get(self, name):
+        """Value of a declared artifact."""
+        if name not in self.values:
+            if name not in self.artifacts:
+                raise KeyError(f"Unknown artifact {name}")
+            compute, names = self.artifacts[name]
+            inputs = {}
+            for key in names:
+                if key in self.inputs:
+                    inputs[key] = self.inputs[key]
+                elif key in self.artifacts or key in self.values:
+                    inputs[key] = self.get(key)
+                else:
+                    raise KeyError(f"Input {key} of artifact {name} is not set")
+            self._evaluate(name, lambda: compute(*inputs.values()), inputs)
+        return self.values[name][0]
+
+    def derive(self, name, compute, **inputs):
+        """Value of an artifact declared inline: compute() depends on the given inputs only."""
+        if name in self.inputs or name in self.artifacts:
+            raise ValueError(f"Artifact {name} has the name of an input or of a declared artifact")
+        if name not in self.values:
+            self._evaluate(name, compute, inputs)
+        return self.values[name][0]
+
+    def _evaluate(self, name, compute, inputs):
+        tokens, refs = {}, []
+        for key, value in inputs.items():
+            if key in self.values:
+                # An artifact: same key and same object as the one the dependant was computed from
+                tokens[key] = self.values[key][1]
+                refs.append(value)
+            elif key.startswith("_"):
+                tokens[key] = ("id", id(value))
+                refs.append(value)
+            else:
+                tokens[key] = token(value)
+        key = fingerprint(name, sorted(tokens.items()))
+        entry = self.flow.cache.get(key)
+        if entry is not None and all(ref() is value for ref, value in zip(entry[1], refs)):
+            self.values[name] = (entry[0], key)
+            self.steps.append(Step(name, "reused", "", 0.0))
+            return
+        start = time.perf_counter()
+        value = compute()
+        self.flow.cache.put(key, (value, [reference(ref) for ref in refs]))
+        self.values[name] = (value, key)
+        self.steps.append(Step(name, "computed", self.flow._changed(name, tokens), time.perf_counter() - start))
+
+    def report(self):
+        """Table of the steps of the run (artifact, status, reason, seconds)."""
+        return pd.DataFrame(self.steps, columns=Step._fields)
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+
+
+def default_store_path():
+    """
+    Location of the local event store. Can be changed with the QUIZ_DASH_STORE
+    environment variable (an empty value disables the store).
+    """
+    path = os.environ.get("QUIZ_DASH_STORE")
+    if path is None:
+        path = Path.home() / ".quiz_dash" / "events.sqlite"
+    return path
+
+
+def sheet_key(url):
+    """Partition key of a sheet (the secret is never stored)."""
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+
+
+def event_day(raw):
+    """Day partition (YYYY-MM-DD) of raw rows, from their timestamp (ingestion day if unreadable)."""
+    today = time.strftime("%Y-%m-%d")
+    if "timestamp" not in raw.columns:
+        return pd.Series(today, index=raw.index)
+    ts = pd.to_datetime(raw["timestamp"].astype(str).str.split(r' \(').str[0], errors="coerce", utc=True)
+    return ts.dt.strftime("%Y-%m-%d").fillna(today)
+
+
+class EventStore:
+    """
+    On-disk store (SQLite) of the raw sheet rows, partitioned by sheet and by day.
+
+    The incremental event log writes the new rows through to the store, with its
+    watermark, so that after a server restart or a global reset the log is reloaded
+    from disk and only the rows added to the sheet in the meantime are decoded.
+    Only the recent partitions need to be loaded for live monitoring; older days
+    can be read on demand.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path if path is not None else default_store_path())
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as con:
+            con.execute("""CREATE TABLE IF NOT EXISTS events (
+                            sheet TEXT, day TEXT, row INTEGER, payload TEXT,
+                            PRIMARY KEY (sheet, row))""")
+            con.execute("CREATE INDEX IF NOT EXISTS events_day ON events (sheet, day)")
+            con.execute("""CREATE TABLE IF NOT EXISTS sheets (
+                            sheet TEXT PRIMARY KEY, n_rows INTEGER, watermark TEXT)""")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def append(self, sheet, raw, n_rows, watermark):
+        """Stores raw rows (index = row position in the sheet) and the new watermark."""
+        days = event_day(raw)
+        records = raw.to_dict(orient="records")
+        values = [(sheet, day, int(row), json.dumps(rec, default=str))
+                  for row, day, rec in zip(raw.index, days, records)]
+        with self._connect() as con:
+            con.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?)", values)
+            con.execute("INSERT OR REPLACE INTO sheets VALUES (?, ?, ?)",
+                        (sheet, int(n_rows), json.dumps(watermark)))
+
+    def watermark(self, sheet):
+        """Returns (n_rows, watermark) stored for the sheet, or (0, None)."""
+        with self._connect() as con:
+            res = con.execute("SELECT n_rows, watermark FROM sheets WHERE sheet = ?", (sheet,)).fetchone()
+        if res is None:
+            return 0, None
+        return res[0], tuple(json.loads(res[1])) if res[1] else None
+
+    def load(self, sheet, since=None, until=None):
+        """Raw rows of the sheet for days in [since, until] (all days if None), index = row position."""
+        query = "SELECT row, payload FROM events WHERE sheet = ?"
+        args = [sheet]
+        if since is not None:
+            query += " AND day >= ?"
+            args.append(since)
+        if until is not None:
+            query += " AND day <= ?"
+            args.append(until)
+        with self._connect() as con:
+            res = con.execute(query + " ORDER BY row", args).fetchall()
+        if not res:
+            return pd.DataFrame()
+        return pd.DataFrame([json.loads(p) for _, p in res], index=[r for r, _ in res])
+
+    def sheets(self):
+        """Keys of the sheets present in the store."""
+        with self._connect() as con:
+            return [r[0] for r in con.execute("SELECT sheet FROM sheets ORDER BY sheet").fetchall()]
+
+    def days(self, sheet):
+        """Available day partitions for the sheet, with their number of events."""
+        with self._connect() as con:
+            res = con.execute("SELECT day, COUNT(*) FROM events WHERE sheet = ? GROUP BY day ORDER BY day",
+                              (sheet,)).fetchall()
+        return pd.DataFrame(res, columns=["day", "events"])
+
+    def clear(self, sheet):
+        with self._connect() as con:
+            con.execute("DELETE FROM events WHERE sheet = ?", (sheet,))
+            con.execute("DELETE FROM sheets WHERE sheet = ?", (sheet,))
+
+
+def open_store(path=None):
+    """Opens the default event store, or returns None if disabled or not writable."""
+    path = path if path is not None else default_store_path()
+    if not path:
+        return None
+    try:
+        return EventStore(path)
+    except Exception as e:
+        print("Event store unavailable:", e)
+        return None
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+
+class GroupPartition:
+    """
+    Row positions of each class group of a frame, computed once (categorical codes,
+    one stable sort): selecting a group is then a lookup and a positional take,
+    instead of a query scanning the whole frame.
+    """
+
+    def __init__(self, values):
+        values = pd.Categorical(values)
+        codes = np.asarray(values.codes)
+        order = np.argsort(codes, kind="stable")
+        # Missing groups have code -1 and are sorted first, out of every slice
+        bounds = np.searchsorted(codes[order], np.arange(len(values.categories) + 1))
+        self.groups = list(values.categories)
+        self.positions = {g: order[bounds[k]:bounds[k + 1]] for k, g in enumerate(values.categories)}
+        self.size = len(codes)
+
+    @classmethod
+    def of(cls, df, column="class_group"):
+        if column not in df.columns:
+            return cls(pd.Series([None] * len(df), dtype=object))
+        return cls(df[column])
+
+    def select(self, df, group):
+        """Rows of df (the partitioned frame, or one with the same rows) in the given group."""
+        if len(df) != self.size:
+            raise ValueError("Frame does not match the partition")
+        return df.iloc[self.positions.get(group, np.empty(0, dtype=np.intp))]
@@ -0,0 +1,490 @@
+import hashlib
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+from labquiz.putils import parse_custom_dict
+
+from event_store import event_day
+
+
+# Event types kept in the "filtered" table (same as labquiz.putils.readData)
+FILTERED_EVENTS = ['validate', 'validate_exam', 'correction']
+# Attempts taken into account for the monitoring
+VALID_EVENTS = ['validate', 'validate_exam']
+# Repeated strings of the log, held as categoricals
+CATEGORY_COLUMNS = ['student', 'quiz_title', 'event_type', 'notebook_id', 'timestamp_tz']
+# Row label offset between the sources of a merged log (see merge_events)
+SOURCE_STRIDE = 10**9
+# Format of the event timestamps, before their parenthesised suffix (timezone)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_timestamps(df):
+    """
+    Adds the parsed event timestamps to df (in place): `timestamp_dt` (datetime64, read with
+    TIMESTAMP_FORMAT, other formats being guessed row by row) and `timestamp_tz`, the
+    parenthesised suffix of the raw timestamp. The raw `timestamp` column is kept.
+    """
+    # (no columns are returned by partition for an empty frame)
+    parts = df["timestamp"].astype(str).str.partition(" (").reindex(columns=range(3), fill_value="")
+    head, suffix = parts[0], parts[2]
+    parsed = pd.to_datetime(head, format=TIMESTAMP_FORMAT, errors="coerce")
+    others = parsed.isna() & df["timestamp"].notna()
+    if others.any():
+        parsed = parsed.astype(object)
+        parsed[others] = [pd.to_datetime(t, errors="coerce") for t in head[others]]
+        parsed = pd.to_datetime(parsed, errors="coerce")
+    df["timestamp_dt"] = parsed
+    df["timestamp_tz"] = suffix.str.rstrip(")").where(suffix != "")
+    return df
+
+
+def parse_events(raw):
+    """
+    Decodes raw sheet rows like labquiz.putils.readData does (student normalization, 
+    answers and parameters decoding), and parses their timestamps (parse_timestamps).
+    """
+    raw["student"] = raw["student"].apply(lambda s: s.strip() if isinstance(s, str) else s)
+    raw["answers"] = raw["answers"].apply(parse_custom_dict)
+    # The parameters are the same for most events: each distinct text is decoded once,
+    # and the rows share the resulting dict
+    codes, texts = pd.factorize(raw["parameters"])
+    decoded = np.empty(len(texts) + 1, dtype=object)
+    decoded[:len(texts)] = [parse_custom_dict(t) for t in texts]
+    decoded[-1] = np.nan
+    raw["parameters"] = decoded[codes]
+    return parse_timestamps(raw)
+
+
+def compact_events(df, like=None):
+    """
+    Compact layout of parsed events: categoricals for the repeated strings, float32 scores.
+    The categories extend those of `like` (the log the events are appended to), so that
+    both can be concatenated without going back to objects. They are kept sorted, so that
+    sorts and groupbys give the same order as on the strings.
+    """
+    df = df.copy(deep=False)
+    for col in CATEGORY_COLUMNS:
+        if col not in df.columns:
+            continue
+        known = like[col].cat.categories if like is not None and col in like.columns else pd.Index([])
+        categories = known.append(pd.Index(pd.unique(df[col].dropna())).difference(known, sort=False))
+        try:
+            categories = categories.sort_values()
+        except TypeError:
+            pass  # Mixed types, kept in order of appearance
+        df[col] = pd.Categorical(df[col], categories=categories)
+    if "score" in df.columns and pd.api.types.is_numeric_dtype(df["score"]):
+        df["score"] = df["score"].astype("float32")
+    return df
+
+
+def extend_categories(df, like):
+    """df (not modified) with the categories of `like`, a superset of its own."""
+    df = df.copy(deep=False)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and col in like.columns and not df[col].cat.categories.equals(like[col].cat.categories):
+            df[col] = df[col].cat.set_categories(like[col].cat.categories)
+    return df
+
+
+def column_bytes(values, shared=True):
+    """Memory held by a column; objects referenced by several rows are counted once if `shared`."""
+    if values.dtype != object:
+        return int(values.memory_usage(index=False, deep=True))
+    objects = {id(v): v for v in values}.values() if shared else values
+    return 8 * len(values) + sum(sys.getsizeof(v) for v in objects)
+
+
+def merge_events(frames, names):
+    """
+    Merges the event frames of several logs into one, sorted by timestamp, with a categorical
+    `source` column (the name of each frame). Row labels stay unique and stable: the rows of
+    the k-th frame are labelled k * SOURCE_STRIDE + their label in it.
+    """
+    frames = [(k, f) for k, f in enumerate(frames) if f is not None]
+    if not frames:
+        return None
+    aligned = []
+    for k, f in frames:
+        f = f.copy(deep=False)
+        for col in CATEGORY_COLUMNS:
+            if col in f.columns and not isinstance(f[col].dtype, pd.CategoricalDtype):
+                f[col] = f[col].astype("category")
+        f.index = f.index + k * SOURCE_STRIDE
+        aligned.append((k, f))
+    # Union of the categories, so that the concatenation stays categorical
+    for col in CATEGORY_COLUMNS:
+        present = [f[col].cat.categories for _, f in aligned if col in f.columns]
+        if not present:
+            continue
+        categories = present[0].append(present[1:]).unique()
+        try:
+            categories = categories.sort_values()
+        except TypeError:
+            pass
+        for _, f in aligned:
+            if col in f.columns and not f[col].cat.categories.equals(categories):
+                f[col] = f[col].cat.set_categories(categories)
+    df = pd.concat([f for _, f in aligned])
+    df["source"] = pd.Categorical.from_codes(np.repeat([k for k, _ in aligned], [len(f) for _, f in aligned]),
+                                             categories=names)
+    return df.sort_values("timestamp", kind="mergesort")
+
+
+def memory_report(df):
+    """
+    Bytes per event of the log, as held (compact) and with the loose layout of readData
+    (objects for every string, one dict per row, float64 scores).
+    """
+    n = max(len(df), 1)
+    index_bytes = int(df.index.memory_usage(deep=True))
+    compact_bytes = index_bytes + sum(column_bytes(df[col]) for col in df.columns)
+    loose_bytes = index_bytes
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+        elif col == "score":
+            values = values.astype("float64")
+        loose_bytes += column_bytes(values, shared=False)
+    return {"events": len(df), "bytes_per_event": round(compact_bytes / n, 1),
+            "loose_bytes_per_event": round(loose_bytes / n, 1),
+            "ratio": round(loose_bytes / max(compact_bytes, 1), 2)}
+
+
+class LastAttemptTable:
+    """
+    Last valid attempt of each (student, quiz_title) made before the correction was
+    shown, as computed by prepare_monitoring_data, maintained from the events appended
+    to the log: each update only scans the rows added since the previous one.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.n_seen = 0           # Number of rows of the log already scanned
+        self.corrected = set()    # (student, quiz_title) whose correction was shown
+        self.last = {}            # (student, quiz_title) -> (position, row label)
+
+    def update(self, df, rebuild=False):
+        """Scans the new rows of df (the whole of it if rebuild, e.g. after a re-sort)."""
+        if rebuild or len(df) < self.n_seen:
+            self.reset()
+        new = df.iloc[self.n_seen:]
+        rows = zip(new.index, new["student"], new["quiz_title"], new["event_type"])
+        for pos, (label, student, quiz_title, event_type) in enumerate(rows, start=self.n_seen):
+            if pd.isna(student) or pd.isna(quiz_title):
+                continue
+            key = (student, quiz_title)
+            if event_type == "correction":
+                self.corrected.add(key)
+            elif event_type in VALID_EVENTS and key not in self.corrected:
+                self.last[key] = (pos, label)
+        self.n_seen = len(df)
+
+    def frame(self, df):
+        """Rows of df (the log it was built from) that are last attempts, in log order."""
+        labels = [label for _, label in sorted(self.last.values())]
+        df_last = df.loc[labels].copy()
+        df_last["has_seen_correction"] = False
+        return df_last
+
+
+def row_hashes(raw):
+    """Content hash of each raw row, used to de-duplicate events."""
+    return pd.util.hash_pandas_object(raw.astype(str), index=False).to_numpy()
+
+
+def chain_fingerprint(previous, hashes):
+    """Fingerprint of a log after appending rows with the given hashes to a log of fingerprint `previous`."""
+    data = (previous or "").encode("ascii") + np.asarray(hashes, dtype=np.uint64).tobytes()
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def content_fingerprint(df):
+    """Fingerprint of the content of an event frame (for frames not read through a log)."""
+    return chain_fingerprint(None, row_hashes(df))
+
+
+class IncrementalEventLog:
+    """
+    Parsed event log of one event source (see sources.py), kept between refreshes.
+
+    The sheet is append-only: the watermark is the number of raw rows already
+    ingested, together with the timestamp/send_timestamp of the last of them.
+    On each read, only the rows after the watermark are decoded, de-duplicated
+    and appended, so the cost of a refresh grows with the number of new events
+    and not with the size of the whole log. If the watermark row does not match
+    anymore (sheet cleared or edited), the log is rebuilt from scratch.
+
+    With an EventStore, new raw rows are written through to disk and the log is
+    restored from it on creation. `history_days` limits the events kept in memory
+    to the last days (None keeps everything); older days stay on disk.
+    """
+
+    def __init__(self, source, store=None, history_days=None, verbose=False):
+        self.source = source
+        self.store = store
+        self.sheet = source.key
+        self.history_days = history_days
+        self.verbose = verbose
+        self.df = None
+        self.n_rows = 0           # Number of raw rows already ingested
+        self.watermark = None     # (timestamp, send_timestamp) of the last raw row ingested
+        self.version = 0          # Incremented each time new events are appended
+        self.fingerprint = None   # Content fingerprint of the rows ingested (chained at each append)
+        self.error = None         # Error of the last read, None if it succeeded
+        self._hashes = set()
+        self._last_attempts = LastAttemptTable()
+        self._lock = threading.Lock()
+        if self.store is not None:
+            self.restore()
+
+    def reset(self):
+        self.df = None
+        self.n_rows = 0
+        self.watermark = None
+        self.fingerprint = None
+        self._hashes = set()
+        self._last_attempts.reset()
+        if self.store is not None:
+            self.store.clear(self.sheet)
+
+    def first_day(self):
+        """First day kept in memory (None if the whole history is kept)."""
+        if not self.history_days:
+            return None
+        return time.strftime("%Y-%m-%d", time.localtime(time.time() - 86400 * (self.history_days - 1)))
+
+    def restore(self):
+        """Reloads the recent partitions and the watermark from the event store."""
+        with self._lock:
+            n_rows, watermark = self.store.watermark(self.sheet)
+            if n_rows == 0:
+                return
+            raw = self.store.load(self.sheet, since=self.first_day())
+            if raw.empty:
+                return  # Nothing recent on disk: full read of the sheet
+            hashes = row_hashes(raw)
+            self._hashes.update(hashes.tolist())
+            self.fingerprint = chain_fingerprint(None, hashes)
+            self.df = compact_events(parse_events(raw)).sort_values("timestamp", kind="mergesort")
+            self.df.attrs["fingerprint"] = self.fingerprint
+            self._last_attempts.update(self.df, rebuild=True)
+            self.n_rows, self.watermark = n_rows, watermark
+            self.version += 1
+            if self.verbose: print(f"Event log restored from store: {len(raw)} events, {n_rows} rows")
+
+    def _row_key(self, row):
+        return (str(row.get("timestamp", "")), str(row.get("send_timestamp", "")))
+
+    def _read_tail(self, data):
+        """
+        Reads the rows after the watermark (plus the watermark row itself, for checking).
+        `data` is either the CSV text of the sheet or an already loaded raw dataframe.
+        """
+        def read(skip=0):
+            if isinstance(data, str):
+                return pd.read_csv(StringIO(data), skiprows=range(1, skip + 1) if skip else None)
+            return data.iloc[skip:].reset_index(drop=True)
+
+        if self.n_rows == 0:
+            return read(), 0
+        start = self.n_rows - 1
+        tail = read(start)
+        if tail.empty or self._row_key(tail.iloc[0]) != self.watermark:
+            if self.verbose: print("Watermark not found, full reload of the event log")
+            self.reset()
+            return read(), 0
+        return tail.iloc[1:], start + 1
+
+    def update(self, data):
+        """Ingests a fresh export of the source. Returns the number of new events."""
+        with self._lock:
+            new, start = self._read_tail(data)
+            n_total = start + len(new)
+            if len(new) == 0:
+                return 0
+            new.index = pd.RangeIndex(start, n_total)  # Same index as the row position in the sheet
+            last = new.iloc[-1]
+
+            # De-duplication (identical rows sent twice)
+            hashes = row_hashes(new)
+            keep = []
+            for h in hashes.tolist():
+                keep.append(h not in self._hashes)
+                self._hashes.add(h)
+            new = new[keep]
+            if len(new):
+                self.fingerprint = chain_fingerprint(self.fingerprint, hashes[keep])
+            if self.store is not None:
+                self.store.append(self.sheet, new, n_total, self._row_key(last))
+            first_day = self.first_day()
+            if first_day is not None:
+                new = new[(event_day(new) >= first_day).to_numpy()]
+            new = parse_events(new.copy())
+
+            previous = self.df
+            rebuild = previous is None or previous.empty
+            if rebuild:
+                df = compact_events(new).sort_values("timestamp", kind="mergesort")
+            else:
+                new = compact_events(new, like=previous)
+                df = pd.concat([extend_categories(previous, new), new])
+                # Late events (out of order in the sheet) require a new sort
+                if len(new) and new["timestamp"].min() < previous["timestamp"].max():
+                    df = df.sort_values("timestamp", kind="mergesort")
+                    rebuild = True
+
+            df.attrs["fingerprint"] = self.fingerprint
+            self.df = df
+            self._last_attempts.update(df, rebuild=rebuild)
+            self.n_rows = n_total
+            self.watermark = self._row_key(last)
+            if len(new): self.version += 1
+            return len(new)
+
+    def load_history(self, since=None, until=None):
+        """Reads older days from the event store on demand, as (df, df_filt)."""
+        if self.store is None:
+            return None, None
+        raw = self.store.load(self.sheet, since=since, until=until)
+        if raw.empty:
+            return None, None
+        df = compact_events(parse_events(raw)).sort_values("timestamp", kind="mergesort")
+        return df, df[df["event_type"].isin(FILTERED_EVENTS)]
+
+    def frames(self):
+        """Returns (df, df_filt) as labquiz.putils.readData would."""
+        df = self.df
+        if df is None:
+            return None, None
+        df_filt = df[df["event_type"].isin(FILTERED_EVENTS)]
+        return df, df_filt
+
+    def last_attempts(self, fingerprint=None):
+        """
+        Same as prepare_monitoring_data on the whole log (before student columns split), or None.
+        With a fingerprint, None as well if the log is no longer the one of that fingerprint.
+        """
+        with self._lock:
+            if self.df is None or (fingerprint is not None and fingerprint != self.fingerprint):
+                return None
+            return self._last_attempts.frame(self.df)
+
+    def read(self):
+        """Fetches the source, ingests the new rows, returns (df, df_filt) or (None, None) on error."""
+        try:
+            n_new = self.update(self.source.fetch())
+            if self.verbose: print(f"{n_new} new event(s), {self.n_rows} rows in the source")
+        except Exception as e:
+            print("Loading error", e)
+            self.error = e
+            return None, None
+        self.error = None
+        return self.frames()
+
+
+class MultiEventLog:
+    """
+    Several event logs (e.g. one sheet per lab room) seen as one: on each read, the sources
+    are fetched concurrently, each within `timeout` seconds (a late source keeps its previous
+    events and is not fetched again until its download completes), and the logs are merged
+    by merge_events. Same interface as IncrementalEventLog for reading.
+    """
+
+    def __init__(self, logs, names, timeout=None, verbose=False):
+        self.logs = logs
+        self.names = list(names)
+        self.timeout = timeout
+        self.verbose = verbose
+        self.df = None
+        self.version = 0
+        self.fingerprint = None   # Content fingerprint of the merged logs
+        self._versions = None     # Versions of the logs merged in self.df
+        self._fingerprints = None # Fingerprints of the logs merged in self.df
+        self.error = None         # Error of the last read when no source could be read
+        self._pool = ThreadPoolExecutor(max_workers=len(logs), thread_name_prefix="quiz_dash-source")
+        self._futures = [None] * len(logs)
+        self._lock = threading.Lock()
+
+    def _fetch(self, k):
+        log = self.logs[k]
+        log.update(log.source.fetch())
+
+    def _merge(self):
+        versions = [log.version for log in self.logs]
+        if versions != self._versions:
+            self.df = merge_events([log.df for log in self.logs], self.names)
+            self._fingerprints = [log.fingerprint for log in self.logs]
+            self.fingerprint = hashlib.sha1(
+                " ".join(str(f) for f in self._fingerprints).encode("ascii")).hexdigest()[:16]
+            if self.df is not None:
+                self.df.attrs["fingerprint"] = self.fingerprint
+            self._versions = versions
+            self.version += 1
+
+    def update(self):
+        """Fetches all the sources at once (those still downloading are not fetched again)."""
+        with self._lock:
+            for k in range(len(self.logs)):
+                if self._futures[k] is None or self._futures[k].done():
+                    self._futures[k] = self._pool.submit(self._fetch, k)
+            done, late = wait(self._futures, timeout=self.timeout)
+            errors = []
+            for k, future in enumerate(self._futures):
+                if future in late:
+                    print(f"Source {self.names[k]}: no answer within {self.timeout} s, previous events kept")
+                elif future.exception() is not None:
+                    print(f"Source {self.names[k]}: loading error", future.exception())
+                    errors.append(future.exception())
+            # A source which fails keeps its previous events; the read fails if none answered
+            self.error = errors[0] if errors and len(errors) == len(done) else None
+            self._merge()
+
+    def frames(self):
+        """Returns (df, df_filt) as labquiz.putils.readData would, with a `source` column."""
+        df = self.df
+        if df is None:
+            return None, None
+        return df, df[df["event_type"].isin(FILTERED_EVENTS)]
+
+    def last_attempts(self, fingerprint=None):
+        """
+        Last valid attempts of each log, in the order of the merged log (or None). None as well
+        if a log changed since the merge (a late source), or if the merged log is no longer 
+        the one of the given fingerprint.
+        """
+        with self._lock:
+            df = self.df
+            if df is None or (fingerprint is not None and fingerprint != self.fingerprint):
+                return None
+            labels = []
+            for k, (log, merged) in enumerate(zip(self.logs, self._fingerprints)):
+                if merged is None:
+                    continue  # Log empty when merged
+                df_last = log.last_attempts(merged)
+                if df_last is None:
+                    return None
+                labels.append(df_last.index + k * SOURCE_STRIDE)
+            if not labels:
+                return None
+            df_last = df[df.index.isin(labels[0].append(labels[1:]))].copy()
+            df_last["has_seen_correction"] = False
+            return df_last
+
+    def read(self):
+        """Fetches the sources, merges the logs, returns (df, df_filt) or (None, None)."""
+        self.update()
+        if self.error is not None:
+            return None, None
+        if self.verbose: print(f"Merged log: {0 if self.df is None else len(self.df)} events, version {self.version}")
+        return self.frames()
@@ -0,0 +1,113 @@
+import threading
+
+import pandas as pd
+
+from labquiz.putils import diff_dicts, make_ano_report, local_tz
+
+
+REPORT_COLUMNS = ['idx', 'timestamp', 'student', 'anomalies']
+# Value of a missing key, as in labquiz.putils.diff_dicts
+MISSING = "<absente>"
+
+
+def report_timestamps(timestamps):
+    """Timestamps as shown in the integrity report (local time, to the minute), as in labquiz."""
+    parsed = pd.to_datetime(timestamps.astype(str).str.split(' \\(').str[0], utc=True, errors="coerce")
+    return parsed.dt.tz_convert(local_tz).dt.strftime("%Y-%m-%d %H:%M")
+
+
+class IntegrityMonitor:
+    """
+    Integrity report of an event log (labquiz.putils.make_anomalies_df_report), maintained
+    incrementally: each update only checks the events not seen before, against the reference
+    parameters. The comparison is done once per distinct parameters dict (the compact log
+    shares them between rows). The state of each student (notebooks, last parameters, last
+    full hash) is kept, and the anomalies of the last update are available as a delta.
+
+    The full hash is not part of the checked parameters: it is verified when the report is
+    made, so that it can be turned on or off without checking the log again.
+    """
+
+    def __init__(self, reference, ignore_keys=()):
+        self.reference = {k: v for k, v in reference.items() if k != 'full_hash'}
+        self.wanted_hash = reference.get('full_hash')
+        self.ignore_keys = list(ignore_keys)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.seen = pd.Index([])   # Labels of the events already checked
+        self.rows = {}             # label -> (timestamp, student, anomalies dict, notebook_id, full hash)
+        self.students = {}         # student -> {"notebooks", "parameters", "full_hash"}
+        self.last_new = []         # Labels of the events checked by the last update
+        self._diffs = {}           # id(parameters) -> (parameters, anomalies dict)
+
+    def _diff(self, label, params):
+        known = self._diffs.get(id(params))
+        if known is None or known[0] is not params:
+            anomaly, _, out = diff_dicts(row_idx=label, current=params, reference=self.reference,
+                                         ignore_keys=self.ignore_keys, ignore_paths=[])
+            known = (params, out if anomaly else {})
+            self._diffs[id(params)] = known
+        return known[1]
+
+    def update(self, df):
+        """
+        Checks the events of df not seen yet (all of them if events were removed and others
+        added). Returns their number. A df without new events (e.g. an older snapshot of the
+        same log) leaves the state, including the last delta, unchanged.
+        """
+        with self._lock:
+            is_known = df.index.isin(self.seen)
+            if is_known.all():
+                return 0
+            if is_known.sum() < len(self.seen):
+                self.reset()
+                is_known[:] = False
+            new = df[~is_known]
+            self.last_new = []
+            timestamps = report_timestamps(new["timestamp"])
+            notebooks = new["notebook_id"] if "notebook_id" in new.columns else [None] * len(new)
+            for label, params, student, notebook, timestamp in zip(new.index, new["parameters"], new["student"],
+                                                                    notebooks, timestamps):
+                if not isinstance(params, dict) or len(params) == 0:
+                    continue
+                out = self._diff(label, params)
+                self.rows[label] = (timestamp, student, out, notebook, params.get('full_hash', MISSING))
+                self.last_new.append(label)
+                if not pd.isnull(student):
+                    state = self.students.setdefault(student, {"notebooks": set(), "parameters": None,
+                                                               "full_hash": None})
+                    state["notebooks"].add(notebook)
+                    state["parameters"] = params
+                    state["full_hash"] = params.get("full_hash", state["full_hash"])
+            self.seen = self.seen.append(new.index)
+            return len(new)
+
+    def anomalies(self, label, wanted_hash=None):
+        """Anomalies dict of an event, with the full hash verified against wanted_hash if given."""
+        out, reported = self.rows[label][2], self.rows[label][4]
+        if wanted_hash is None or reported == wanted_hash:
+            return out
+        out = dict(out, full_hash=(wanted_hash, reported))
+        # Same order as the keys of the reference in diff_dicts
+        return {key: out[key] for key in set(self.reference) | {'full_hash'} if key in out}
+
+    def report(self, labels=None, includeRAS=True, only_new=False, wanted_hash=None):
+        """
+        Report table (idx, timestamp, student, anomalies) of the checked events, or of those
+        with the given labels, or of the anomalies found by the last update (only_new).
+        The full hash is verified against wanted_hash (by default, the one of the reference).
+        """
+        wanted_hash = wanted_hash if wanted_hash is not None else self.wanted_hash
+        with self._lock:
+            selected = self.last_new if only_new else sorted(self.rows)
+            if labels is not None:
+                selected = [label for label in selected if label in labels]
+            records = []
+            for label in selected:
+                timestamp, student = self.rows[label][:2]
+                out = self.anomalies(label, wanted_hash)
+                if (includeRAS and not only_new or out) and not pd.isnull(student):
+                    records.append((label, timestamp, student, make_ano_report(out, includeRAS)))
+        return pd.DataFrame(records, columns=REPORT_COLUMNS)
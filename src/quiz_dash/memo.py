@@ -0,0 +1,76 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def fingerprint(*parts):
+    """Short stable key of the given parts (their repr)."""
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """
+    Bounded memo (least recently used entries evicted first), shared between the
+    sessions of the server: lookups and insertions are thread-safe.
+    Entries older than `ttl` seconds are dropped. With a `sizeof` function, the
+    memory held by the entries is accounted for (see stats), and bounded by `maxbytes`
+    if given (the last entry inserted is always kept).
+    """
+
+    def __init__(self, maxsize=16, ttl=None, sizeof=None, maxbytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()   # key -> (value, insertion time, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _expired(self, entry):
+        return self.ttl is not None and time.time() - entry[1] > self.ttl
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._expired(entry):
+                del self._data[key]
+                self._bytes -= entry[2]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._data[key] = (value, time.time(), size)
+            self._bytes += size
+            while len(self._data) > self.maxsize or (
+                    self.maxbytes is not None and self._bytes > self.maxbytes and len(self._data) > 1):
+                self._bytes -= self._data.popitem(last=False)[1][2]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Hits, misses, evictions, number of entries and bytes held."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._data), "bytes": self._bytes}
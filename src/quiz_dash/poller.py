@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import namedtuple
+
+
+# State of the event log published by a poller: (df, df_filt) as returned by the log,
+# its version, and the time of the fetch that produced it
+Snapshot = namedtuple("Snapshot", ["version", "fetched_at", "df", "df_filt"])
+
+
+class LogPoller:
+    """
+    Process-wide poller of one event log (IncrementalEventLog): a background thread fetches
+    the source on a schedule, and publishes versioned snapshots that the sessions read
+    without waiting. Concurrent refresh requests are coalesced into a single in-flight read.
+    The thread stops by itself when no session has read the log for `idle_periods` periods.
+    When a fetch fails, the last snapshot is kept and the error is recorded: the source is
+    not fetched again before `retry_delay` seconds, doubled at each new failure up to
+    `max_retry_delay`.
+    """
+
+    def __init__(self, log, idle_periods=3, retry_delay=10, max_retry_delay=300, verbose=False):
+        self.log = log
+        self.idle_periods = idle_periods
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.verbose = verbose
+        self.snapshot = None
+        self.interval = None      # Polling period (s), None when not polling
+        self.error = None         # Error of the last fetch, None if it succeeded
+        self.failed_at = None     # Time of the last failed fetch
+        self.failures = 0         # Number of consecutive failed fetches
+        self.last_access = time.time()
+        self._pending = None      # Event set when the in-flight read completes
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Fetches the source now (or waits for the read already in flight). Returns the snapshot."""
+        with self._lock:
+            pending, leader = self._pending, self._pending is None
+            if leader:
+                pending = self._pending = threading.Event()
+        if not leader:
+            pending.wait()
+            return self.snapshot
+        try:
+            df, df_filt = self.log.read()
+            if df is not None:
+                self.snapshot = Snapshot(self.log.version, time.time(), df, df_filt)
+                self.error, self.failures = None, 0
+            else:
+                self.error = getattr(self.log, "error", None) or RuntimeError("no event read")
+                self.failed_at = time.time()
+                self.failures += 1
+        finally:
+            with self._lock:
+                self._pending = None
+            pending.set()
+        return self.snapshot
+
+    def retry_at(self):
+        """Time before which a failing source is not fetched again (None after a success)."""
+        if self.error is None:
+            return None
+        return self.failed_at + min(self.max_retry_delay, self.retry_delay * 2 ** (self.failures - 1))
+
+    def read(self, max_age=None):
+        """
+        Latest snapshot, fetched first if there is none yet or if it is older than max_age
+        seconds (unless the source failed less than the retry delay ago). Returns (df, df_filt),
+        or (None, None) if the source could not be read; see `error` for the last fetch.
+        """
+        self.last_access = time.time()
+        snapshot = self.snapshot
+        expired = snapshot is None or (max_age is not None and time.time() - snapshot.fetched_at > max_age)
+        retry_at = self.retry_at()
+        if expired and (retry_at is None or time.time() >= retry_at):
+            snapshot = self.refresh()
+        if snapshot is None:
+            return None, None
+        return snapshot.df, snapshot.df_filt
+
+    def schedule(self, interval):
+        """Polls the source every `interval` seconds (the shortest period requested is kept)."""
+        self.last_access = time.time()
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+            self.interval = interval if not running or self.interval is None else min(self.interval, interval)
+            if not running:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="quiz_dash-poller")
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            interval = self.interval
+            time.sleep(interval)
+            if time.time() - self.last_access > self.idle_periods * interval:
+                with self._lock:
+                    self.interval = None
+                    self._thread = None
+                if self.verbose: print("Poller stopped (no reader)")
+                return
+            retry_at = self.retry_at()
+            if retry_at is not None and time.time() < retry_at:
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                print("Polling error", e)
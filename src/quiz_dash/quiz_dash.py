@@ -2,6 +2,7 @@ import streamlit as st
 import streamlit.components.v1 as components
 
 import pandas as pd
+import numpy as np
 import time
 from streamlit_autorefresh import st_autorefresh
 from streamlit_local_storage import LocalStorage
@@ -11,8 +12,8 @@ import zlib
 import zipfile
 import io
 import json 
-import re
-import markdown
+import os
+import hashlib
 
 #import matplotlib.pyplot as plt
 import plotly.express as px
@@ -24,8 +25,7 @@ from labquiz.main import QuizLab
 from labquiz.putils import (
     readData, 
     check_integrity_msg, 
-    check_hash_integrity, 
-    correctQuizzesDf)
+    check_hash_integrity)
 from labquiz.utils import calculate_quiz_score
 
 
@@ -35,6 +35,19 @@ local_storage = None
 verbose = False
 
 from i18n import init_i18n, set_language, get_translator
+from ingest import IncrementalEventLog, MultiEventLog, VALID_EVENTS, parse_timestamps, content_fingerprint
+from event_store import open_store
+from sources import make_source, is_sheet_url, split_urls, SOURCE_TIMEOUT
+from scoring import correct_quizzes, ClassCorrection
+from memo import LRUCache, fingerprint
+from dataflow import Dataflow
+from groups import GroupPartition
+from students import StudentRegistry
+from integrity import IntegrityMonitor
+from poller import LogPoller
+from reports import (natural_key, generate_pdf_report, render_reports, 
+                     make_individual_report as build_individual_report,
+                     new_export_file, remove_export, export_download_data, MAX_RENDER_WORKERS)
 _ = init_i18n(default_lang="en")
 
 
@@ -117,6 +130,8 @@ def sync(key):
 
 def perform_global_reset():
         global local_storage
+        for key in ("zipped_pdf_reports", "zipped_html_reports"):
+            remove_export(st.session_state.get(key))
         local_storage.deleteAll()
         while len(local_storage.storedItems) > 0:
             time.sleep(0.1)
@@ -129,25 +144,224 @@ def perform_global_reset():
         st.rerun()
 
 
-@st.cache_data(show_spinner=False)
+@st.cache_resource(show_spinner=False)
+def get_event_store():
+    # Local on-disk store of events (survives restarts and global resets)
+    return open_store()
+
+@st.cache_resource(show_spinner=False)
+def get_event_log(url, secret, history_days=None):
+    # One incremental log per source, shared by all sessions
+    # Several sources are read concurrently and merged, each one keeping its own log
+    urls = list(dict.fromkeys(split_urls(url)))
+    if len(urls) > 1:
+        return MultiEventLog([get_event_log(u, secret, history_days) for u in urls], names=urls, 
+                             timeout=SOURCE_TIMEOUT, verbose=verbose)
+    url = urls[0] if urls else url
+    # Local files and replays are not written to the event store
+    store = get_event_store() if is_sheet_url(url) else None
+    return IncrementalEventLog(make_source(url, secret), store=store, 
+                               history_days=history_days, verbose=verbose)
+
+def uses_event_log(url, incremental):
+    # Sheets are read with readData unless incremental loading is on; other sources and 
+    # several sources always go through the event log
+    return incremental or not is_sheet_url(url) or len(split_urls(url)) > 1
+
+@st.cache_resource(show_spinner=False)
+def get_poller(url, secret, history_days=None):
+    # One poller per event log, shared by all sessions
+    return LogPoller(get_event_log(url, secret, history_days), verbose=verbose)
+
+def poll_events(url, secret, refresh_key, interval=None, history_days=None):
+    """
+    Events of the shared poller: its latest snapshot, fetched first if older than the refresh 
+    period, or if "Refresh now" was clicked in this session. With auto-refresh, the poller 
+    fetches in the background so that sessions do not wait for the source. If the source 
+    could not be read, the last events read are kept (with a warning) until it answers again.
+    """
+    poller = get_poller(url, secret, history_days)
+    if interval is not None:
+        poller.schedule(interval)
+    previous_key = st.session_state.get("polled_key", refresh_key)
+    st.session_state.polled_key = refresh_key
+    if previous_key != refresh_key:
+        poller.refresh()
+    df, df_filt = poller.read(max_age=interval)
+    snapshot = poller.snapshot
+    if poller.error is not None and df is not None and snapshot is not None:
+        minutes = int((time.time() - snapshot.fetched_at) // 60)
+        st.warning(_("Data could not be refreshed ({error}): events read {minutes} min ago are shown").format(
+            error=poller.error, minutes=minutes))
+    return df, df_filt
+
+# Read cache of adhocReadData: entries kept, and their lifetime (s)
+READ_CACHE_ENTRIES = 4
+READ_CACHE_TTL = 3600
+# Derived artifacts memo: entries kept, and memory they may hold
+DATAFLOW_ENTRIES = 64
+DATAFLOW_MAX_BYTES = 512 * 2**20
+
+def frames_nbytes(frames):
+    return int(sum(f.memory_usage(index=True, deep=True).sum() for f in frames if f is not None))
+
+@st.cache_resource(show_spinner=False)
+def get_read_cache():
+    # (df, df_filt) per data version, and the data version read for each refresh tick
+    return {"frames": LRUCache(maxsize=READ_CACHE_ENTRIES, ttl=READ_CACHE_TTL, sizeof=frames_nbytes),
+            "ticks": LRUCache(maxsize=256, ttl=READ_CACHE_TTL)}
+
 def adhocReadData(url, secret, autorefresh, button_refresh):
+    """
+    Reads the events with labquiz's readData (when the incremental event log is not used,
+    see poll_events). The frames are cached per data version (url, number of events, 
+    last timestamp), in a bounded cache shared by the sessions: a refresh tick that brings 
+    no new event reuses the frames already held, and a rerun within the same tick does 
+    not read again.
+    """
     import time
     if verbose:print("Reading data...")
     time.sleep(0)
     tic = time.perf_counter()
-    df, df_filt = readData(url, secret)
+    cache = get_read_cache()
+    tick = fingerprint(url, secret, autorefresh, button_refresh)
+    version = cache["ticks"].get(tick)
+    frames = cache["frames"].get(version) if version is not None else None
+    if frames is None:
+        df, df_filt = readData(url, secret)
+        if df is not None and df_filt is not None:
+            df, df_filt = parse_timestamps(df), parse_timestamps(df_filt)
+            df.attrs["fingerprint"] = df_filt.attrs["fingerprint"] = content_fingerprint(df)
+        if df is None or df_filt is None:
+            return None, None
+        version = event_log_version(url, df)
+        frames = cache["frames"].get(version)
+        if frames is None:
+            frames = (df, df_filt)
+            cache["frames"].put(version, frames)
+        cache["ticks"].put(tick, version)
     toc = time.perf_counter()
     if verbose: print(f"Reading data execution time: {toc-tic:.3f} seconde(s)")
-    return df, df_filt
+    return frames
+
+def quiz_file_key(quiz_file):
+    # Content hash of the uploaded (or restored) quiz file
+    return hashlib.sha1(quiz_file.getvalue()).hexdigest()
+
+def build_quiz(quiz_file, params_str):
+    params = eval(params_str)
+    quiz_file.seek(0)
+    quiz = QuizLab("", quiz_file, needAuthentification=False, mandatoryInternet=False, 
+                   in_streamlit=True, silentStart=True, **params)
+    # Propositions sorted on labels (mandatory for corrections) once, before the quiz is shared: 
+    # the reports and corrections only read the bank
+    for entry in quiz.quiz_bank.values():
+        propositions = entry.get('propositions') if isinstance(entry, dict) else None
+        if isinstance(propositions, list) and all(isinstance(p, dict) and "label" in p for p in propositions):
+            propositions.sort(key=lambda d: d["label"])
+    return quiz
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_quiz(file_key, params_str, _quiz_file):
+    # Parsed quiz, shared by all sessions and reruns while the file and parameters are unchanged
+    return build_quiz(_quiz_file, params_str)
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_quiz_hash(file_key, params_str, _quiz_file):
+    # Integrity hash, only computed when requested, on a fresh instance (the shared quiz 
+    # is not touched by the hash computation)
+    from labquiz.utils import get_full_object_hash
+    return get_full_object_hash(build_quiz(_quiz_file, params_str), modules=['main', 'utils'], 
+                                WATCHLIST=['retries', 'exam_mode', 'test_mode'])
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_integrity_monitor(url, reference_key, source_key, _reference):
+    # Integrity report of the event log of url against a reference, shared by the sessions
+    # reading the same snapshots (source_key: incremental loading and history window)
+    return IntegrityMonitor(_reference)
+
+# Student strings kept by the shared registry before it is started anew
+STUDENT_REGISTRY_MAX = 50_000
+
+@st.cache_resource(show_spinner=False)
+def get_student_registries():
+    # Current student registry, shared by all sessions
+    return {"current": StudentRegistry()}
+
+def get_student_registry():
+    """
+    Student identities parsed so far. The registry is replaced by an empty one once it holds 
+    more than STUDENT_REGISTRY_MAX students, so that a server hosting class after class does 
+    not keep them all. Ids are only valid within the registry returned.
+    """
+    registries = get_student_registries()
+    registry = registries["current"]
+    if len(registry) > STUDENT_REGISTRY_MAX:
+        registry = registries["current"] = StudentRegistry()
+    return registry
 
 def generate_cols_from_student(df, dropStudent=False):
-    split_cols = df['student'].str.split(r'\s*,\s*', expand=True)
-    split_cols.columns = ['name', 'firstname', 'class_group'][:split_cols.shape[1]]
+    # Each distinct student string is only parsed once (registry), then the columns are taken by id
+    registry = get_student_registry()
+    fields = registry.fields(registry.register(df['student']))
+    dtype = None if isinstance(df['student'].dtype, pd.CategoricalDtype) else df['student'].dtype
+    split_cols = pd.DataFrame({col: pd.Series(values, index=df.index, dtype=dtype) 
+                               for col, values in fields.items()})
     newdf = pd.concat([split_cols, df], axis=1)
     if dropStudent: newdf = newdf.drop(columns='student')
     return newdf
 
-def recompute_score(adj_bareme, questions, exam_title, df_results, full_df, full_df_filt, quiz, seuil, final_weights, maxtries):
+def results_table(res):
+    # Results of the correction, with the student columns split
+    res = res.reset_index().rename(columns={"index": "student"})
+    res = generate_cols_from_student(res, dropStudent=True)
+    return res.drop(columns=['Note', 'maxpts'], errors='ignore')
+
+@st.cache_resource(show_spinner=False)
+def get_exam_scores_cache():
+    # Last exam corrections (recompute_score), shared by all sessions
+    return LRUCache(maxsize=8)
+
+def event_log_version(url, df):
+    # Identifies a state of the (append-only) event log: number of events, last timestamp 
+    # and content fingerprint (kept by the event log, or computed when the frames were read)
+    return (url, len(df), str(df['timestamp'].iloc[-1]) if len(df) else None, df.attrs.get("fingerprint"))
+
+@st.cache_resource(show_spinner=False)
+def get_dataflow():
+    # Artifacts derived from the events and the widgets, shared by all sessions
+    return Dataflow(maxsize=DATAFLOW_ENTRIES, maxbytes=DATAFLOW_MAX_BYTES)
+
+def dataflow_run():
+    # Evaluation of the artifacts for the current rerun of this session (see main)
+    if "dataflow_run" not in st.session_state:
+        st.session_state.dataflow_run = get_dataflow().run(ARTIFACTS)
+    return st.session_state.dataflow_run
+
+def derived(name, compute, **inputs):
+    """
+    Artifact `name` computed from the given inputs (data version, group, params...): 
+    computed once, then reused by the following reruns and sessions until an input changes.
+    Inputs whose name starts with '_' are compared by identity.
+    The artifacts are shared and must not be modified in place.
+    """
+    return dataflow_run().derive(name, compute, **inputs)
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def get_group_partition(version, kind, _df):
+    # Class groups of the event frames (kind 'events' or 'filt'), computed once per data version
+    return GroupPartition.of(_df)
+
+def results_partition():
+    # Class groups of the results table, recomputed only when a new df_final is set
+    part = st.session_state.get("final_groups")
+    if part is None or part[0] is not st.session_state.df_final:
+        part = (st.session_state.df_final, GroupPartition.of(st.session_state.df_final))
+        st.session_state.final_groups = part
+    return part[1]
+
+def recompute_score(adj_bareme, questions, exam_title, df_results, full_df, full_df_filt, quiz, seuil, final_weights, maxtries, 
+                    data_version=None):
 
     coeffs = adj_bareme.loc["Coefficient"]
     res_copy = df_results.copy()
@@ -156,15 +370,27 @@ def recompute_score(adj_bareme, questions, exam_title, df_results, full_df, full
         # Scalar product
         res_copy["FinalMark"] = res_copy[questions].dot(coeffs) * (20 / sum(coeffs))
     else:
-        # Complete calcul
-        res_copy = correctQuizzesDf(
+        # Complete calcul, memoized on the data version and grading parameters 
+        # (reruns caused by other widgets do not correct the exam again)
+        key = None
+        if data_version is not None:
+            cache = get_exam_scores_cache()
+            key = fingerprint(data_version, exam_title, list(coeffs.items()), seuil, 
+                              sorted(final_weights.items()), maxtries)
+            cached = cache.get(key)
+            if cached is not None and cached[0] is quiz:
+                return cached[1].copy()
+        res_copy = correct_quizzes(
             data=full_df, data_filt=full_df_filt, quiz=quiz, 
             title=exam_title, seuil=seuil, weights=final_weights, 
             bareme=coeffs, maxtries=maxtries
         )
         res_copy["FinalMark"] = res_copy["Note"]
         res_copy.drop(columns='Note', inplace=True, errors='ignore')
+        res_copy = res_copy.reset_index().rename(columns={"index": "student"})
         res_copy = generate_cols_from_student(res_copy, dropStudent=False)
+        if key is not None:
+            cache.put(key, (quiz, res_copy.copy()))
     #print(res_copy.columns, res_copy.head(5))
     return res_copy
 
@@ -232,22 +458,39 @@ def prepare_monitoring_data(df):
     Filters the dataframe to keep only the last valid attempts 
     before the correction was shown.
     """
-    df_copy = df.copy()
-    
     # Identify if a student has already seen the correction for a specific quiz
-    df_copy.loc[:, "has_seen_correction"] = (
-        df_copy["event_type"].eq("correction")
-        .groupby([df_copy["student"], df_copy["quiz_title"]])
+    # (computed aside, the whole log is not copied)
+    seen = (
+        df["event_type"].eq("correction")
+        .groupby([df["student"], df["quiz_title"]], observed=True)
         .transform("cummax")
     ).fillna(False).astype(bool)
 
     # Filter to get the last 'validate' or 'validate_exam' event before correction
     df_last = (
-        df_copy.query("(event_type == 'validate' or event_type == 'validate_exam') and not has_seen_correction", engine="python")
-        .groupby(["student", "quiz_title"], as_index=False)
+        df[df["event_type"].isin(VALID_EVENTS).to_numpy() & ~seen.to_numpy()]
+        .groupby(["student", "quiz_title"], as_index=False, observed=True)
         .tail(1)
     )
     
+    return df_last.assign(has_seen_correction=False)
+
+
+def last_attempts(url, secret, df, group=None, incremental=True, history_days=None, fingerprint=None):
+    """
+    prepare_monitoring_data(df), read from the last-attempt table kept up to date 
+    by the incremental event log when it is used; the group is filtered afterwards.
+    `fingerprint` is the one of the snapshot df comes from: if the log has moved on since,
+    df itself is used (the table is only valid for the current state of the log).
+    """
+    if not uses_event_log(url, incremental):
+        return prepare_monitoring_data(df)
+    df_last = get_event_log(url, secret, history_days).last_attempts(fingerprint)
+    if df_last is None:
+        return prepare_monitoring_data(df)
+    df_last = generate_cols_from_student(df_last, dropStudent=False)
+    if group is not None and group != _('All') and 'class_group' in df_last.columns:
+        df_last = df_last.query("class_group == @group")
     return df_last
 
 
@@ -264,30 +507,31 @@ def create_monitoring_plot(data, title, plot_type="student_counts", lang_func=No
     
     # Data processing based on plot_type
     if plot_type == "student_counts":
-        series = data.groupby("student")["quiz_title"].count().sort_index(ascending=False)
+        series = data.groupby("student", observed=True)["quiz_title"].count().sort_index(ascending=False)
         color = "#3498db"
         x_label = _("Number of Quizzes")
 
     elif plot_type == "student_scores":
-        series = data.groupby("student")["score"].sum().sort_index(ascending=False)
+        series = data.groupby("student", observed=True)["score"].sum().sort_index(ascending=False)
         color = "#f1c40f"
         x_label = _("Total Score")
 
     elif plot_type == "class_results":
-        series = data["quiz_title"].value_counts().sort_index(
+        series = data["quiz_title"].value_counts()
+        series = series[series > 0].sort_index(
             key=lambda idx: idx.str.extract(r"(\d+)").fillna(0).astype(int)[0]
         )
         color = "#2ecc71"
         x_label = _("Number of Students")
 
     elif plot_type == "hardest_quizzes":
-        series = data.groupby("quiz_title")["score"].mean().sort_values(ascending=False).tail(5)
+        series = data.groupby("quiz_title", observed=True)["score"].mean().sort_values(ascending=False).tail(5)
         color = "#e74c3c"
         x_label = _("Average Score")
 
     elif plot_type == "quizzes_selectivity":
         nb_students = data['student'].nunique()
-        series = (data.groupby("quiz_title")["score"].sum() / nb_students).sort_values(ascending=False)
+        series = (data.groupby("quiz_title", observed=True)["score"].sum() / nb_students).sort_values(ascending=False)
         color = "#e74c3c"
         x_label = _("Selectivity Score")
 
@@ -334,6 +578,14 @@ def create_monitoring_plot(data, title, plot_type="student_counts", lang_func=No
     return fig
 
 
+def monitoring_figure(df_last, title, plot_type, version, group):
+    # Spec of a monitoring plot (as given to st.plotly_chart), built once per data version, 
+    # group and language: reruns and tab switches reuse it
+    return derived("figure_" + plot_type, 
+                   lambda: create_monitoring_plot(df_last, title, plot_type, _).to_dict(), 
+                   version=version, group=group, lang=st.session_state.lang, _df_last=df_last)
+
+
 @st.dialog(_("Histogram of marks"))
 def show_histogram(marks):
     fig = px.histogram(
@@ -354,34 +606,101 @@ def show_histogram(marks):
     st.plotly_chart(fig, use_container_width=True)
 
 
-def plot_student_session_track(student_data, student_name):
+# Timeline layout: breaks longer than TIMELINE_BREAK minutes are shrunk to TIMELINE_SHUNT 
+# minutes on the x axis; ticks and stem labels are at least TIMELINE_MIN_DIST apart
+TIMELINE_BREAK = 60
+TIMELINE_SHUNT = 15
+TIMELINE_MIN_DIST = 2
+
+def thin_positions(plot_x, min_dist):
+    """Indexes of the positions kept when each one must be more than min_dist after the previous kept one."""
+    n = len(plot_x)
+    if n == 0:
+        return np.array([], dtype=int)
+    if not (np.diff(plot_x) >= 0).all():
+        # Not sorted (or NaN): plain scan
+        kept, last = [], -100
+        for i, x in enumerate(plot_x):
+            if x - last > min_dist:
+                kept.append(i)
+                last = x
+        return np.array(kept, dtype=int)
+    kept, last, i = [], -100, -1
+    while True:
+        j = max(int(np.searchsorted(plot_x, last + min_dist, side='right')), i + 1)
+        # Exact comparison of the scan (x - last > min_dist) around the rounding boundary
+        while j < n and not plot_x[j] - last > min_dist:
+            j += 1
+        while j - 1 > i and plot_x[j - 1] - last > min_dist:
+            j -= 1
+        if j >= n:
+            break
+        kept.append(j)
+        last, i = plot_x[j], j
+    return np.array(kept, dtype=int)
+
+def short_quiz_names(quiz_titles):
+    """Stem labels of the quizzes: q + first number of the title (the title if it has none)."""
+    titles = pd.Series(quiz_titles, dtype=object).astype(str).reset_index(drop=True)
+    return ("q" + titles.str.extract(r"(\d+)", expand=False).fillna(titles)).to_numpy()
+
+def timeline_layout(real_min, quiz_titles=None, short_names=None):
+    """
+    Compressed x axis of a student timeline, from the elapsed minutes of the events 
+    (sorted by time): positions, breaks, ticks and stem labels.
+    """
+    real_min = np.asarray(real_min, dtype=float)
+    n = len(real_min)
+    delta = np.diff(real_min)
+    long_break = delta > TIMELINE_BREAK
+    steps = np.concatenate([[0.0], np.where(long_break, TIMELINE_SHUNT, delta)])
+    plot_x = np.cumsum(steps)
+    pause_positions = (plot_x[:-1][long_break] + (TIMELINE_SHUNT / 2)).tolist()
+
+    ticks = thin_positions(plot_x, TIMELINE_MIN_DIST)
+    tick_vals = plot_x[ticks].tolist()
+    tick_texts = [str(int(v)) for v in real_min[ticks]]
+
+    # Stem labels (q1, q2...), hidden when too close
+    if short_names is None:
+        short_names = short_quiz_names(quiz_titles)
+    stem_labels = np.full(n, "", dtype=object)
+    stem_labels[ticks] = short_names[ticks]  # Same spacing rule as the ticks
+
+    return {"plot_x": plot_x.tolist(), "pause_positions": pause_positions, "tick_vals": tick_vals, 
+            "tick_texts": tick_texts, "stem_labels": stem_labels.tolist(), "real_min": real_min}
+
+def student_timelines(df_last, quiz_stats):
+    """
+    Timelines of all the students in one pass: returns {student: (student_data, layout)}, 
+    with student_data as expected by plot_student_session_track.
+    """
+    data = df_last.copy()
+    data['timestamp'] = data['timestamp_dt']
+    data = data.merge(quiz_stats, on="quiz_title").sort_values(["student", "timestamp"], kind="mergesort")
+    real_min = ((data['timestamp'] - data.groupby("student", observed=True)['timestamp'].transform("min"))
+                .dt.total_seconds() / 60).to_numpy()
+    short_names = short_quiz_names(data["quiz_title"])
+    # Rows are sorted by student: one contiguous block per student
+    students, starts = np.unique(data["student"].to_numpy(), return_index=True)
+    ends = np.append(starts[1:], len(data))
+    timelines = {}
+    for student, a, b in zip(students, starts, ends):
+        timelines[student] = (data.iloc[a:b], timeline_layout(real_min[a:b], short_names=short_names[a:b]))
+    return timelines
+
+def plot_student_session_track(student_data, student_name, timeline=None):
     
     # Real elapsed time from the start (in minutes)
-    start_time = student_data['timestamp'].min()
-    student_data['real_min'] = (student_data['timestamp'] - start_time).dt.total_seconds() / 60
-    
-    # 1. Build the compressed X axis
-    threshold = 60 # 1 hour break
-    shunted_gap = 15 
-    
-    plot_x = []
-    current_plot_x = 0.0
-    pause_positions = []
-    
-    # We store the real values to use as labels on the X axis
-    tick_vals = [0.0]
-    tick_texts = ["0"]
-    # Logic for both Axis labels and Stem labels
-    last_tick_pos = -100
-    last_stem_label_pos = -100
-    
-    # Thresholds (adjust based on your visual preference)
-    min_dist_ticks = 2 
-    min_dist_labels = 2 # q1, q2 often take more horizontal space than numbers
-    
-    stem_labels = [] # To store q1, q2... or ""
-    tick_vals = []
-    tick_texts = []
+    if timeline is None:
+        start_time = student_data['timestamp'].min()
+        real_min = (student_data['timestamp'] - start_time).dt.total_seconds() / 60
+        timeline = timeline_layout(real_min, student_data["quiz_title"])
+    real_min = pd.Series(timeline["real_min"], index=student_data.index)
+    plot_x = timeline["plot_x"]
+    pause_positions = timeline["pause_positions"]
+    tick_vals, tick_texts = timeline["tick_vals"], timeline["tick_texts"]
+    stem_labels = timeline["stem_labels"]
 
     # Calcul des limites de l'axe Y avec une petite marge (10%)
     y_min = student_data["score"].min()
@@ -391,34 +710,9 @@ def plot_student_session_track(student_data, student_name):
     plot_y_min = min(-0.1, y_min - 0.1)
     plot_y_max = max(1.1, y_max + 0.2)
 
-
-    for i in range(len(student_data)):
-        # (Relative positioning in the x axis based on elapsed time)
-        real_delta = student_data.iloc[i]['real_min'] - (student_data.iloc[i-1]['real_min'] if i > 0 else 0)
-        if i > 0 and real_delta > threshold:
-            pause_positions.append(current_plot_x + (shunted_gap / 2))
-            current_plot_x += shunted_gap
-        elif i > 0:
-            current_plot_x += real_delta
-        plot_x.append(current_plot_x)
-
-        # 1. Logic for X-Axis Labels (the numbers)
-        if current_plot_x - last_tick_pos > min_dist_ticks:
-            tick_vals.append(current_plot_x)
-            tick_texts.append(str(int(student_data.iloc[i]['real_min'])))
-            last_tick_pos = current_plot_x
-        
-        # 2. Logic for Stem Labels (q1, q2...)
-        short_name = "q" + re.search(r"(\d+)", str(student_data.iloc[i]["quiz_title"])).group(1)
-        if current_plot_x - last_stem_label_pos > min_dist_labels:
-            stem_labels.append(short_name)
-            last_stem_label_pos = current_plot_x
-        else:
-            stem_labels.append("") # Hide the label if too close
-
     hover_data = list(zip(
         student_data["timestamp"].dt.strftime('%H:%M'),
-        student_data["real_min"].round(1),
+        real_min.round(1),
         student_data["quiz_title"],
         student_data["timestamp"].dt.strftime('%d/%m/%Y')
     ))
@@ -517,33 +811,11 @@ def plot_student_session_track(student_data, student_name):
 
     return fig
 
-def natural_key(string_): #Gemini
-    """Splits the string into a list of strings and integers."""
-    return [int(s) if s.isdigit() else s.lower() for s in re.split(r'(\d+)', string_)]
-
-def markdown_to_safe_html(text):
-    text = text.replace("&lt;br&gt;", "<br>")
-    # Conversion Markdown → HTML
-    html_output = markdown.markdown(
-        text,
-        extensions=["extra", "sane_lists"]
-    ).replace("<p>", "").replace("</p>", "")
-    return html_output
-
-def generate_pdf_report(html):
-    from io import BytesIO
-    from weasyprint import HTML, CSS
-
-    buffer = BytesIO()
-    HTML(string=html).write_pdf(target=buffer, stylesheets=[CSS(string=pdf_css)])
-    pdf_bytes = buffer.getvalue()
-    return pdf_bytes #HTML(string=html).write_pdf()
-
 def prepare_student_data(df_last, marks_df, quiz_stats, selected_student):
 
     student_data = df_last[df_last["name"] + " " + df_last["firstname"] == selected_student].copy()
     student_data.drop(['send_timestamp', 'notebook_id', 'student', 'event_type', 'parameters', 'has_seen_correction'], axis=1, inplace=True)
-    student_data['timestamp'] = pd.to_datetime(student_data['timestamp'].str.split(' \(').str[0])
+    student_data['timestamp'] = student_data['timestamp_dt']
     from_marks = marks_df[marks_df["full_names"] == selected_student]
     id_vars = ['name', 'firstname', 'class_group', 'FinalMark', 'full_names']
     df_marks = from_marks.melt(
@@ -560,305 +832,116 @@ def prepare_student_data(df_last, marks_df, quiz_stats, selected_student):
 
     return student_data
 
-def make_individual_report(selected_student, df_last, student_data, quiz, final_weights, bareme, fullCorrection=True):
-    
+def report_context(df_last, quiz, final_weights, bareme, fullCorrection=True):
+    """Settings shared by all the individual reports of the class."""
     FinalMarkScale = int(st.session_state.TrueFinalMarkScale)
-    full_avg_note = st.session_state.df_final["FinalMark"].mean()*FinalMarkScale/20
-    full_std_note = st.session_state.df_final["FinalMark"].std()*FinalMarkScale/20
-    FinalMark = student_data.loc[:, 'FinalMark'].mean()*FinalMarkScale/20
-    class_mean=full_avg_note
-    class_std=full_std_note
-
-    info_marks = _("Final mark: {FinalMark:.2f} / {FinalMarkScale} -- Class mean: {class_mean:.2f} & Standard deviation: {class_std:.2f}").format(FinalMark=FinalMark, 
-                                        FinalMarkScale=FinalMarkScale, 
-                                        class_mean=class_mean, class_std=class_std)
-
-
-    html_output = True
-
-    html = """
-    <html>
-    <head>
-    <script>
-    window.MathJax={tex:{inlineMath:[['$','$']],displayMath:[['$$','$$']]}};
-    </script>
-    <script src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-chtml.js"></script>
-
-    <style>
-    body{font-family:Arial,sans-serif;margin:40px}
-    h1{border-bottom:2px solid #444;padding-bottom:5px}
-    .indent{margin-left:20px}
-    .question{margin-top:25px;padding:15px;border:1px solid #ddd;border-radius:8px;background:#fafafa}
-    .prop{margin-left:10px;margin-top:4px}
-
-    .correct,.incorrect,.missed{font-weight:bold}
-    .correct{color:green}
-    .incorrect{color:red}
-    .missed{color:orange}
-
-    .checkbox{font-family:monospace;margin-right:6px}
-
-    .prop-row{display:flex;gap:10px;margin:4px 0 4px 20px}
-    .col-checkbox{width:30px;font-family:monospace}
-    .col-text{flex:1}
-    .col-status{width:50px;font-weight:bold}
-    .col-mark{width:50px;text-align:right}
-
-    @page{size:A4;margin:10mm}
-    </style>
-    </head>
-    <body>
-        """
-
-    block_size = 12
-    n_cols = bareme.shape[1]
-    bareme_html = ""
-    for i in range(0, n_cols, block_size):
-        sub_df = bareme.iloc[:, i:i+block_size]
-        bareme_html += "<br>" + sub_df.to_html(index=True, float_format='{:.2f}'.format, classes='table table-bordered', border=1)
-
-    if html_output:
-        html += """<h1>{Report_for} {student_name}</h1>
-            <p><b>{info_marks}</b></p>
-            <p></p>
-            <p>{scale_str} {scale}</p>
-            """.format(Report_for=_("Correction for"), Student=(_("Student")),
-                scale_str=_("Scale:"), scale=bareme_html, student_name=selected_student, info_marks=info_marks)
-        html += '<hr style="border: none; border-top: 2px solid #000; margin: 20px 0;">'
-    else:
-        st.markdown(_("#### Report for ") + selected_student)
-        st.write(info_marks)
-
-    
-    list_quizzes = sorted(df_last["quiz_title"].unique(), key=natural_key)
-    for q in list_quizzes:
-        current_quiz = quiz.quiz_bank[q]
-        question = current_quiz['question']
-        propositions = current_quiz['propositions']
-        propositions.sort(key=lambda d: d["label"]) # sort on keys - mandatory for corrections
-        constraints = current_quiz.get('constraints', {})
-        quiz_type = current_quiz['type']
-
-        correct_answers = {prop['label']: prop['expected'] for prop in current_quiz['propositions']}
-        correct_answers = {k:correct_answers[k] for k in sorted(correct_answers)}
-        try: 
-            user_answers = student_data.loc[q, 'answers']
-            user_answers = {k:user_answers[k] for k in sorted(user_answers)} # sort on keys (shoul be already sorted, but security)
-        except:
-            user_answers = {}
-        
-        score, total_possible, details = calculate_quiz_score(quiz_type, user_answers, propositions, 
-                    question=question, weights=final_weights, constraints=constraints, return_details=True)
-
-        question = details['question']
-        propositions = details['propositions']
-        marks = details['marks']
-        violations = details['violations'] 
-
-        if html_output:
-            html += """
-                <p></p> <h3 style="display: inline;">{q} - </h3>
-                <span> <em>{question}</em> </span> 
-                """.format(q=q, question=markdown_to_safe_html(question))
-        else:
-            st.markdown(f"## {q}")
-            st.write("**{q}** -- {question}".format(q=q, question=question))
-
-
-        if len(user_answers) == 0:
-            if html_output:
-                html += "<p class='indent'>{no_answer}</p>".format(no_answer=_("No answer"))
-            else:
-                st.write(_("No answer"))
-            continue
-        
-        answererd_at = _("Answered at: ") + pd.to_datetime(student_data.loc[q, 'timestamp']).strftime('%Y-%m-%d %H:%M:%S')
-        if html_output:
-            html += "<p class='indent'>{answererd_at}</p>".format(answererd_at=answererd_at)
-        else:
-            st.write(str(answererd_at))
-    
-
-        if 'mcq' in current_quiz['type']:
-            if fullCorrection:
-                for prop in propositions:
-                    #checkbox = "☑" if user_answers.get(prop['label'], '') else "☐" 
-                    checkbox = "✅" if user_answers.get(prop['label'], '') else "⬜"
-                    Res = _("Correct") if user_answers.get(prop['label'], '') == prop['expected'] else _("Incorrect")
-                    mark = float(marks.get(prop['label'], 0))    
-                    if html_output:
-                        html += """
-                        <div class="prop-row">
-                            <div class="col-checkbox">{checkbox}</div>
-                            <div class="col-text">{propal}</div>
-                            <div class="col-status">{Res}</div>
-                            <div class="col-mark">{mark}</div>
-                        </div>
-                            """.format(checkbox=checkbox, propal=markdown_to_safe_html(prop['proposition']), Res=Res, mark=mark)
-                    else:
-                        st.write("{checkbox}  - {propal} - {Res} - ".format(checkbox=checkbox, propal=prop['proposition'], Res=Res) + _("Mark: ") + "{mark:.2f}".format(mark=mark)) 
-            else:
-                correct = sum([user_answers.get(prop['label'], '') == prop['expected'] for prop in propositions])
-                incorrect = sum([user_answers.get(prop['label'], '') != prop['expected'] for prop in propositions])
-                if html_output:
-                    html += """
-                    <div class="prop-row">
-                        {correct_str} {correct} - {incorrect_str} {incorrect}</div>
-                    </div>
-                        """.format(correct=correct, correct_str=_("Correct"), incorrect=incorrect, incorrect_str=_("Incorrect"))
-                else:
-                    st.write("{correct} {correct_str} - {incorrect} {incorrect_str}".format(correct=correct, correct_str=_("Correct"), incorrect=incorrect, incorrect_str=_("Incorrect")))
-        else:
-            if fullCorrection:
-                for prop in propositions:
-                    pexpected = float(prop.get("expected", 0))
-                    answer = user_answers.get(prop['label'], '')
-                    mark = float(marks.get(prop['label'], 0))
-                    #diff = abs(answer - pexpected)
-                    #tol = max(prop.get("tolerance_abs", 0), 
-                    #        prop.get("tolerance", 0.01) * abs(pexpected)) 
-                    #Res = "Correct" if diff <= tol else "Incorrect"
-                    Res = _("Incorrect") if mark == 0 else _("Correct")
-
-                    if html_output:
-                        html += """
-                        <div class="prop-row indent">
-                            <div class="col-checkbox">{checkbox}</div>
-                            <div class="col-text">{propal}</div>
-                            <div class="col-status">{Res}</div>
-                            <div class="col-mark">{mark}</div>
-                        </div>
-                            """.format(checkbox=answer, propal=markdown_to_safe_html(prop['proposition']), Res=Res, mark=mark)
-                    else:
-                        st.write("Given answer: {answer}  - {propal} - {Res} - ".format(checkbox=checkbox, propal=prop['proposition'], Res=Res) + _("Mark: ") + "{mark:.2f}".format(mark=mark)) 
-            else:
-                correct = sum([user_answers.get(prop['label'], '') == prop['expected'] for prop in propositions])
-                incorrect = sum([user_answers.get(prop['label'], '') != prop['expected'] for prop in propositions])
-                if html_output:
-                    html += """
-                    <div class="prop-row indent">
-                        {correct_str} {correct} - {incorrect_str} {incorrect}</div>
-                        <div class="col-mark"></div>
-                    </div>
-                        """.format(correct=correct, correct_str=_("Correct"), incorrect=incorrect, incorrect_str=_("Incorrect"))
-                else:
-                    st.write("{correct_str} {correct} - {incorrect_str} {incorrect}".format(correct=correct, correct_str=_("Correct"), incorrect=incorrect, incorrect_str=_("Incorrect")))
-        
-        if len(violations) > 0:
-            logical_violations = _("Logical Contraints Violations: ")
-            if html_output:
-                html += "<h3>" + logical_violations + "</h3>"
-                html += "<div class='indent'>"
-            else:
-                st.write(logical_violations)
-
-            for key in violations:
-                if fullCorrection:
-                    current_violation = _("{key}: Violation between {indexes} - Malus:{malus}").format(key=key, 
-                                                    indexes=violations[key]['indexes'], malus=violations[key]['malus'] )
-                    if html_output:
-                        html += current_violation
-                    else:
-                        st.write(current_violation)
-                else:
-                    current_violation = _("Violation {key}: Malus:{malus}").format(key=key, 
-                                                    malus=violations[key]['malus'] )
-                    if html_output:
-                        html += current_violation
-                    else:
-                        st.write(current_violation)
-
-            if html_output:
-                html += "</div>"
-
-        # Final score
-        score_obtained = "Score obtained:  {score} / {total_possible} = {normalized_score:.2f} (class average: {class_avg:.2f} with std: {class_std:.2f})".format(
-                    score=score, total_possible=total_possible, normalized_score=score/total_possible,
-                    class_std=student_data.loc[q, 'std'], class_avg=student_data.loc[q, 'mean'] )
-        if html_output:
-            html += "<br>" + score_obtained 
-            html += """
-                    </body>
-                    </html>"""
-        else:
-            st.write(score_obtained) 
-
-
-    return html
+    return {
+        "list_quizzes": sorted(df_last["quiz_title"].unique(), key=natural_key),
+        "quiz_bank": quiz.quiz_bank,
+        "final_weights": final_weights,
+        "bareme": bareme,
+        "FinalMarkScale": FinalMarkScale,
+        "class_mean": st.session_state.df_final["FinalMark"].mean()*FinalMarkScale/20,
+        "class_std": st.session_state.df_final["FinalMark"].std()*FinalMarkScale/20,
+        "fullCorrection": fullCorrection,
+        "lang": st.session_state.lang,
+    }
 
+def make_individual_report(selected_student, df_last, student_data, quiz, final_weights, bareme, fullCorrection=True):
+    c = report_context(df_last, quiz, final_weights, bareme, fullCorrection)
+    return build_individual_report(selected_student, c["list_quizzes"], student_data, c["quiz_bank"], 
+                                   final_weights, bareme, c["FinalMarkScale"], c["class_mean"], c["class_std"], 
+                                   fullCorrection=fullCorrection, lang_func=_)
 
 def generate_zip_report(students_list, df_last, marks_df, quiz_stats, quiz, 
-                        final_weights, fullCorrection, progress_callback=None, pdf_output=True):
+                        final_weights, fullCorrection, progress_callback=None, pdf_output=True, workers=1,
+                        output=None):
+    """
+    Zip of the reports of all the students. The archive is streamed to `output` 
+    (a path) and the path is returned; without output, the bytes are returned.
+    """
     total = len(students_list)
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for k, student in enumerate(students_list):
-            student_data = prepare_student_data(df_last, marks_df, quiz_stats, student)
-            html_bytes = make_individual_report(student, df_last, student_data, quiz, 
-                    final_weights, st.session_state.scale, fullCorrection=fullCorrection)
-            if pdf_output:
-                pdf_bytes = generate_pdf_report(html_bytes)
-                zip_file.writestr(student + ".pdf", pdf_bytes)
-            else:
-                zip_file.writestr(student + ".html", html_bytes)
-            if progress_callback:
-                progress_callback((k + 1) / total)
-    zip_buffer.seek(0)
-    zip_bytes = zip_buffer.getvalue()
-    return zip_bytes
-    
+    context = report_context(df_last, quiz, final_weights, st.session_state.scale, fullCorrection)
+    # Per-student inputs are prepared here; reports are rendered by `workers` processes
+    tasks = ((student, prepare_student_data(df_last, marks_df, quiz_stats, student)) for student in students_list)
+    extension = ".pdf" if pdf_output else ".html"
+    target = output if output is not None else io.BytesIO()
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for student, content in render_reports(tasks, total, context, workers=workers, 
+                                               pdf_output=pdf_output, progress_callback=progress_callback):
+            zip_file.writestr(student + extension, content)
+    if output is not None:
+        return output
+    return target.getvalue()
 
-# CSS for PDF exports
-pdf_css = """
-@page {
-    size:A4;
-    page-size: A4;
-    margin: 2.5cm;
-    /* Footer area for numbering */
-    @bottom-right {
-        content: "Page " counter(page) "/" counter(pages);
-        font-family: "Liberation Serif", serif;
-        font-size: 9pt;
-        color: #555;
-    }
-}
 
-body {
-    font-family: "Liberation Serif", "Times New Roman", serif;
-    font-size: 11pt;
-    line-height: 1.4;
-    color: black;
-}
-
-/* Title hierarchy */
-h1 {
-    font-size: 14pt;
-    font-weight: bold;
-    text-transform: uppercase;
-    margin-bottom: 0.5cm;
-}
-
-h2 {
-    font-size: 12pt;
-    font-weight: bold;
-    margin-top: 0.4cm;
-    margin-bottom: 0.2cm;
-    border-bottom: 0.5pt solid #ccc; /* Small discreet line to separate sections */
-}
-
-h3 {
-    font-size: 11pt; /* Same size as body, but bold/italic */
-    font-weight: bold;
-    font-style: italic;
-    margin-top: 0.3cm;
-    margin-bottom: 0.1cm;
+#-------------------------------------------------
+#               DERIVED ARTIFACTS                #
+#-------------------------------------------------
+def quiz_score_stats(df_last):
+    # Mean and standard deviation of the last scores, per quiz
+    return df_last.groupby("quiz_title", observed=True)["score"].agg(["mean", "std"]).reset_index()
+
+def activity_summary(df_last):
+    # Number of quizzes, total score and list of the quizzes of each student
+    detailed_stats = (
+        df_last.groupby("student", observed=True)
+        .agg(
+            nb_quizzes=("quiz_title", "size"),
+            total_score=("score", "sum"),
+            quizzes_list=("quiz_title", lambda x: ", ".join(list(x)))
+        )
+        .reset_index()
+    )
+    detailed_stats['student'] = get_student_registry().display_names(detailed_stats['student'])
+    return detailed_stats
+
+def group_results(df_final, group):
+    # Results of the selected group (df_final is the results table of all groups)
+    return df_final if group == _("All") else results_partition().select(df_final, group)
+
+def group_scores(df_results, adj_bareme, questions, exam_title, full_df, full_df_filt, quiz, 
+                 seuil, final_weights, maxtries, version):
+    return recompute_score(adj_bareme, questions, exam_title, df_results, full_df, full_df_filt, quiz, 
+                           seuil, final_weights, maxtries, data_version=version)
+
+def final_mark(df_final, coeffs):
+    # Final mark (/20) of all the students, with the adjusted coefficients
+    return df_final[coeffs.index].dot(coeffs) * (20 / sum(coeffs))
+
+def scaled_scores(df_results, scale):
+    display_scores = df_results.copy()
+    display_scores["FinalMark"] = display_scores["FinalMark"] * int(scale) / 20
+    return display_scores
+
+def marks_table(df_final, final_marks):
+    # Final marks of all the students, with their full names
+    marks_df = df_final.assign(FinalMark=final_marks)
+    marks_df['full_names'] = marks_df["name"] + " " + marks_df["firstname"]
+    return marks_df
+
+# Declared artifacts: (compute, inputs), the inputs being other artifacts (including those 
+# derived inline, see derived), or values set on the run. Names starting with '_' are 
+# compared by identity.
+ARTIFACTS = {
+    "quiz_stats": (quiz_score_stats, ("df_last",)),
+    "detailed_stats": (activity_summary, ("df_last",)),
+    "timelines": (student_timelines, ("df_last", "quiz_stats")),
+    "class_quiz_stats": (quiz_score_stats, ("class_last",)),
+    "group_results": (group_results, ("_df_final", "group")),
+    "scores": (group_scores, ("group_results", "adj_bareme", "questions", "exam_title", "_full_df", 
+                              "_full_df_filt", "_quiz", "seuil", "final_weights", "maxtries", "version")),
+    "final_marks": (final_mark, ("_df_final", "coeffs")),
+    "display_scores": (scaled_scores, ("scores", "scale")),
+    "marks_df": (marks_table, ("_df_final", "final_marks")),
 }
 
-/* Handling intelligent page breaks */
-h1, h2, h3 {
-    page-break-after: avoid; /* Avoid a title being alone at the bottom of the page */
-}
-"""
+def show_dataflow(run):
+    # Debug view: artifacts recomputed or reused by this rerun, and why
+    with st.expander(_("Recomputed data"), expanded=True):
+        stats = run.flow.cache.stats()
+        st.caption(_("{hits} reused, {misses} computed, {entries} entries").format(**stats))
+        st.dataframe(run.report(), hide_index=True, width='stretch')
 
 
 #-------------------------------------------------
@@ -974,7 +1057,8 @@ def main():
     with st.sidebar:
         st.header(_("🔑 Connection"))
         url = st.text_input(_("Google Sheet URL"), placeholder="https://docs.google.com/...", 
-                            key="url", on_change=sync, args=("url",))
+                            key="url", on_change=sync, args=("url",), 
+                            help=_("Several sheets can be monitored together: separate their URLs with spaces or ';'"))
         secret = st.text_input(_("Secret Key"), type="password", key="secret",
                                on_change=sync, args=("secret",))
         label =_('QUIZ file (YAML) containing corrections')
@@ -1028,9 +1112,21 @@ def main():
 
         refresh_min = st.slider(_("Refresh rate (min)"), 1, 30, 10)
         auto_refresh_active = st.checkbox(_("Enable auto-refresh"), value=False)
+        incremental_read = st.checkbox(_("Incremental loading"), value=True, 
+                                       help=_("Only decode the events added since the last refresh"))
+        history_days = st.number_input(_("History kept in memory (days, 0 = all)"), min_value=0, value=0,
+                                       disabled=not incremental_read,
+                                       help=_("Older events remain in the local event store"))
+
+        show_recomputed = st.checkbox(_("Show recomputed data"), value=False, 
+                                      help=_("Data derived on this rerun, and why"))
 
         if st.button(_("🔄 Refresh now"), use_container_width=True):
             st.session_state.refresh_key += 1
+        if not incremental_read:
+            read_stats = get_read_cache()["frames"].stats()
+            st.caption(_("Read cache: {hits} hits, {misses} misses, {entries} entries, {mb:.1f} MB").format(
+                mb=read_stats["bytes"] / 2**20, **read_stats))
 
         if auto_refresh_active:
             st.caption(_('Last update: ') + time.strftime('%H:%M:%S'))
@@ -1086,7 +1182,7 @@ def main():
                     _("TN (True Negative)"): 0.0
                 }, key="weights_editor",  args=("weights_editor",))
                 
-                # Conversion for correctQuizzesDf function
+                # Conversion for the correction functions
                 final_weights = {
                     (True, True): weights_dict[_("TP (True Positive)")],
                     (True, False): weights_dict[_("FP (False Positive)")],
@@ -1103,28 +1199,41 @@ def main():
 
     # --- DATA PROCESSING ---
 
-    if url and secret and quiz_file:
+    if url and (secret or not is_sheet_url(url)) and quiz_file:
         try:
             import copy
+            # Derived artifacts of this rerun (see ARTIFACTS)
+            run = get_dataflow().run(ARTIFACTS)
+            st.session_state.dataflow_run = run
             # 1. Reading
             read_error = False
             with st.spinner(_("Reading data...")):
-                full_df, full_df_filt = adhocReadData(url, secret, refresh_count, st.session_state.refresh_key)
+                if uses_event_log(url, incremental_read):
+                    full_df, full_df_filt = poll_events(url, secret, st.session_state.refresh_key, 
+                                                        interval=refresh_min * 60 if auto_refresh_active else None, 
+                                                        history_days=history_days or None)
+                else:
+                    full_df, full_df_filt = adhocReadData(url, secret, refresh_count, st.session_state.refresh_key)
                 if full_df is None or full_df_filt is None:
                     st.error(_("Data could not be read."))
                     read_error = True
             if read_error: st.stop()
-            full_df = generate_cols_from_student(full_df, dropStudent=False)
-            full_df_filt = generate_cols_from_student(full_df_filt, dropStudent=False)
+            # Nothing below is recomputed while the data version does not change
+            version = event_log_version(url, full_df)
+            full_df, full_df_filt = derived(
+                "student_cols", 
+                lambda: (generate_cols_from_student(full_df, dropStudent=False), 
+                         generate_cols_from_student(full_df_filt, dropStudent=False)), 
+                version=version)
+            run.set(version=version, _full_df=full_df, _full_df_filt=full_df_filt)
             # Group selection
             group = _('All')
 
+            groups_part = get_group_partition(version, 'events', full_df)
+            groups_filt_part = get_group_partition(version, 'filt', full_df_filt)
+
             if 'class_group' in full_df.columns:
-                all_groups = [
-                    g for g in full_df['class_group'].unique()
-                    if g is not None and not pd.isnull(g)
-                ]
-                all_groups.sort()
+                all_groups = groups_part.groups
                 if all_groups:
                     #st.info(_("Select a class or group to monitor."))
                     groups = [ _('All') ] + all_groups
@@ -1140,21 +1249,20 @@ def main():
                 if verbose: print("Group key is not in session state yet")
 
 
+            run.set(group=group)
             if group == _('All'):
                 df, df_filt = full_df, full_df_filt
             else:
-                df = full_df.query("class_group == @group")
-                df_filt = full_df_filt.query("class_group == @group")                
+                df, df_filt = derived("group_frames", 
+                                      lambda: (groups_part.select(full_df, group), 
+                                               groups_filt_part.select(full_df_filt, group)), 
+                                      version=version, group=group)
 
 
             # 2. Instantiate a quiz with the quiz file CONTAINING expected values
             
-            from labquiz.utils import get_full_object_hash, get_big_integrity_hash
-            params = eval(params_str)
-            quiz = QuizLab("", quiz_file, needAuthentification=False, mandatoryInternet=False, 
-                        in_streamlit=True, silentStart=True, **params)              
-            wanted_hash = get_full_object_hash(quiz, modules=['main', 'utils'], 
-                                                WATCHLIST=['retries', 'exam_mode', 'test_mode'])
+            quiz_key = quiz_file_key(quiz_file)
+            quiz = get_quiz(quiz_key, params_str, quiz_file)
 
             # 3. Global integrity check (hash)
             # wanted_hash = # To be defined! st.secrets["hash"]
@@ -1188,7 +1296,7 @@ def main():
                 st.divider() 
                 #with tab_mon:
                 if selected_tab == _("📡 Integrity Live"):
-                    from labquiz.putils import make_anomalies_df_report, group_anomalies_per_student
+                    from labquiz.putils import group_anomalies_per_student
 
                     st.subheader(_("Real-time integrity monitoring"))
                     monitoring_data = [] 
@@ -1202,15 +1310,35 @@ def main():
                         print(e)
 
                     includeRAS = True
+                    wanted_hash = None
                     if st.checkbox(_("Also use full hash"), value=False, 
                                 help=_("Use the full hash of the source code, live object and parameters")):
-                        reference['full_hash'] = wanted_hash
+                        wanted_hash = get_quiz_hash(quiz_key, params_str, quiz_file)
                     if st.checkbox(_("Only display anomalies"), value=False, 
                                 help=_("Display anomalies only, or full report")):
                         includeRAS = False
 
-                    Tab_report = make_anomalies_df_report(df, reference, ignore_keys=[], 
-                                                        includeRAS=includeRAS)
+                    # Only the events received since the previous refresh are checked
+                    monitor = get_integrity_monitor(url, fingerprint(reference), 
+                                                    (incremental_read, history_days), reference)
+
+                    def integrity_reports():
+                        monitor.update(full_df)
+                        # An older snapshot than the one checked last: only its own events are reported
+                        stale = len(monitor.seen) > len(full_df)
+                        group_labels = None if group == _('All') and not stale else set(df.index)
+                        return (monitor.report(group_labels, includeRAS=includeRAS, 
+                                               wanted_hash=wanted_hash),
+                                monitor.report(group_labels, includeRAS=False, only_new=True, 
+                                               wanted_hash=wanted_hash))
+
+                    # Unchanged events: the reports of the previous refresh are reused as they are
+                    Tab_report, New_report = derived("integrity", integrity_reports, version=version, 
+                                                     reference=fingerprint(reference), wanted_hash=wanted_hash, 
+                                                     includeRAS=includeRAS, group=group)
+                    if not New_report.empty:
+                        with st.expander(_("⚠️ {n} new anomalies since the last refresh").format(n=len(New_report))):
+                            st.dataframe(New_report, width='stretch', hide_index=True)
 
                     if st.checkbox(_("Collect anomalies per student"), value=False, 
                                 help=_("Group anomalies per student")):
@@ -1228,7 +1356,11 @@ def main():
                     st.subheader(_("Activity monitoring"))
                     
                     # 1. Data Preparation
-                    df_last = prepare_monitoring_data(df)
+                    df_last = derived("df_last", 
+                                      lambda: last_attempts(url, secret, df, group, incremental=incremental_read, 
+                                                            history_days=history_days or None, 
+                                                            fingerprint=version[3]), 
+                                      version=version, group=group, incremental=incremental_read)
 
                     if df_last.empty:
                         st.info(_("No valid activity recorded yet."))
@@ -1249,22 +1381,22 @@ def main():
                             # Row 1
                             col1, col2 = st.columns(2)
                             with col1:
-                                fig_counts = create_monitoring_plot(df_last, _("Quizzes Completed per Student"), "student_counts", _)
+                                fig_counts = monitoring_figure(df_last, _("Quizzes Completed per Student"), "student_counts", version, group)
                                 st.plotly_chart(fig_counts, use_container_width=True)
                                 #st.plotly_chart(fig, use_container_width=True)
                             with col2:
-                                fig_scores = create_monitoring_plot(df_last, _("Total Scores per Student"), "student_scores", _)
+                                fig_scores = monitoring_figure(df_last, _("Total Scores per Student"), "student_scores", version, group)
                                 st.plotly_chart(fig_scores, use_container_width=True)
 
                             # Row 2
                             col3, col4 = st.columns(2)
                             with col3:
-                                fig_class = create_monitoring_plot(df_last, _("Class Progress per Quiz"), "class_results", _)
+                                fig_class = monitoring_figure(df_last, _("Class Progress per Quiz"), "class_results", version, group)
                                 st.plotly_chart(fig_class, use_container_width=True)
                             with col4:
                                 #fig_hardest = create_monitoring_plot(df_last, _("Top 5 Hardest Quizzes (Avg Score)"), "hardest_quizzes", _)
                                 #st.pyplot(fig_hardest, width="stretch")
-                                fig_most_selective = create_monitoring_plot(df_last, _("Quizzes Selectivity(Avg Score)"), "quizzes_selectivity", _)
+                                fig_most_selective = monitoring_figure(df_last, _("Quizzes Selectivity(Avg Score)"), "quizzes_selectivity", version, group)
                                 st.plotly_chart(fig_most_selective, use_container_width=True)
                                     
                         elif monitoring_tab == monitoring_tab_names[1]:
@@ -1274,20 +1406,7 @@ def main():
                             st.markdown(_("#### Detailed Activity Summary"))
                             
                             # Preparing the table data
-                            detailed_stats = (
-                                df_last.groupby("student")
-                                .agg(
-                                    nb_quizzes=("quiz_title", "size"),
-                                    total_score=("score", "sum"),
-                                    quizzes_list=("quiz_title", lambda x: ", ".join(list(x)))
-                                )
-                                .reset_index()
-                            )
-                            
-                            detailed_stats['student'] = detailed_stats['student'].apply(
-                                lambda x: x.split(',')[0].strip().upper() + ' ' + x.split(',')[1].strip().title() 
-                                    if len(x.split(',')) > 1 else x
-                                    )
+                            detailed_stats = run.get("detailed_stats")
 
                             # Displaying the dataframe with formatted headers
                             st.dataframe(
@@ -1306,21 +1425,17 @@ def main():
                             # 4. Student Timeline
                             st.markdown(_("#### Student Timeline"))
                             
-                            # 1. Global stats calculation
-                            quiz_stats = df_last.groupby("quiz_title")["score"].agg(["mean", "std"]).reset_index()
+                            # 1. Data and layout of every student, prepared in one pass (see student_timelines)
+                            timelines = run.get("timelines")
 
                             # 2. Student Selection
                             all_students = sorted(df_last["student"].unique())
                             selected_student = st.selectbox("Select a student", all_students)
 
                             # 3. Display Plot
-                            if selected_student:
-                                # 1. Data Prep
-                                student_data = df_last[df_last["student"] == selected_student].copy()
-                                student_data['timestamp'] = pd.to_datetime(student_data['timestamp'].str.split(' \(').str[0])
-                                student_data = student_data.merge(quiz_stats, on="quiz_title").sort_values("timestamp")                          
-                                # 2. Plot
-                                fig_timeline = plot_student_session_track(student_data, selected_student)
+                            if selected_student in timelines:
+                                student_data, timeline = timelines[selected_student]
+                                fig_timeline = plot_student_session_track(student_data, selected_student, timeline)
                                 st.plotly_chart(fig_timeline, use_container_width=True)
 
 
@@ -1354,20 +1469,18 @@ def main():
                                     except:
                                         b_dict = {}
                                     
-                                    st.session_state.df_results = correctQuizzesDf(
+                                    # Answers compiled once, then graded (and re-graded when the weights change)
+                                    st.session_state.correction = ClassCorrection(
                                         data=full_df, 
                                         data_filt=full_df_filt, 
                                         quiz=quiz, 
                                         title=exam_title if exam_title != "" else None, 
-                                        seuil=seuil, 
-                                        weights=final_weights, 
                                         bareme=b_dict, 
                                         maxtries=maxtries
                                     )
-                                    st.session_state.df_results = st.session_state.df_results.reset_index().rename(columns={"index": "student"})
-                                    st.session_state.df_results = generate_cols_from_student(st.session_state.df_results, dropStudent=True)
-                                    st.session_state.df_results.drop(columns='Note', inplace=True, errors='ignore')
-                                    st.session_state.df_results.drop(columns='maxpts', inplace=True, errors='ignore')
+                                    st.session_state.graded_with = (final_weights, seuil)
+                                    st.session_state.df_results = results_table(
+                                        st.session_state.correction.grade(final_weights, seuil=seuil, exact=True))
                                     
                                     if exam_title == "":
                                         st.session_state.df_results.drop(columns='Note', inplace=True, errors='ignore')
@@ -1381,12 +1494,17 @@ def main():
                                 st.session_state.df_final = st.session_state.df_results.copy() # All groups in df_final
                             
                                 
+                            if (st.session_state.df_final is not None and st.session_state.get("correction") is not None
+                                    and st.session_state.get("graded_with") != (final_weights, seuil)):
+                                # Weights matrix or threshold changed: re-graded from the confusion counts
+                                st.session_state.df_final = results_table(
+                                    st.session_state.correction.grade(final_weights, seuil=seuil))
+                                st.session_state.graded_with = (final_weights, seuil)
+
                             if st.session_state.df_final is not None:
 
-                                if group != _("All"):
-                                    st.session_state.df_results = st.session_state.df_final.query("class_group == @group")
-                                else:
-                                    st.session_state.df_results = st.session_state.df_final
+                                run.set(_df_final=st.session_state.df_final)
+                                st.session_state.df_results = run.get("group_results")
                                 st.session_state.show_scores = True
                                     
                                 st.markdown(_("#### ⚖️ Adjust Scale"))
@@ -1402,18 +1520,10 @@ def main():
                                 )
                                 st.session_state.scale = adj_bareme
 
-                                st.session_state.df_results = recompute_score(
-                                    adj_bareme, 
-                                    questions, 
-                                    exam_title, 
-                                    st.session_state.df_results, 
-                                    full_df, 
-                                    full_df_filt, 
-                                    quiz, 
-                                    seuil, 
-                                    final_weights, 
-                                    maxtries
-                                )
+                                # Recomputed only when the scale, the grading parameters or the events change
+                                run.set(adj_bareme=adj_bareme, questions=questions, exam_title=exam_title, _quiz=quiz, 
+                                        seuil=seuil, final_weights=final_weights, maxtries=maxtries)
+                                st.session_state.df_results = run.get("scores")
                                 st.session_state.show_scores = True
 
                                 col1, col2, col3 = st.columns([4, 1, 1], vertical_alignment="bottom")
@@ -1433,15 +1543,14 @@ def main():
                                 std_note = st.session_state.df_results["FinalMark"].std()*int(FinalMarkScale)/20
                                 st.caption(_('Average: ') + f"{avg_note:.2f} / {FinalMarkScale}. " + _('Standard deviation: ') + f"{std_note:.2f}")
                                 # Compute stats for All groups
-                                coeffs = adj_bareme.loc["Coefficient"]
-                                st.session_state.df_final["FinalMark"] = st.session_state.df_final[questions].dot(coeffs)*(20/sum(coeffs))
+                                run.set(coeffs=adj_bareme.loc["Coefficient"], scale=FinalMarkScale)
+                                st.session_state.df_final["FinalMark"] = run.get("final_marks")
                                 full_avg_note = st.session_state.df_final["FinalMark"].mean()*int(FinalMarkScale)/20
                                 full_std_note = st.session_state.df_final["FinalMark"].std()*int(FinalMarkScale)/20
                                 
                                 if group != _("All"):
                                     st.caption(_('Class: ') + _('Average: ') + f"{full_avg_note:.2f} / {FinalMarkScale}. " + _('Standard deviation: ') + f"{full_std_note:.2f}")
-                                display_scores = st.session_state.df_results.copy()
-                                display_scores["FinalMark"] = display_scores["FinalMark"]*int(FinalMarkScale)/20
+                                display_scores = run.get("display_scores")
                                 
                                 with col3:
                                     st.button(_("Histogram"), key="histogram", on_click=show_histogram, args=(display_scores["FinalMark"],) )
@@ -1458,15 +1567,19 @@ def main():
                     elif correction_tab == correction_tab_names[1]:
                         if st.session_state.df_final is not None:
 
-                            df_last = prepare_monitoring_data(full_df_filt)
+                            df_last = derived("class_last", 
+                                              lambda: last_attempts(url, secret, full_df_filt, incremental=incremental_read, 
+                                                                    history_days=history_days or None, 
+                                                                    fingerprint=version[3]), 
+                                              version=version, incremental=incremental_read)
                             
                             # 1. Global stats calculation
-                            quiz_stats = df_last.groupby("quiz_title")["score"].agg(["mean", "std"]).reset_index()
-                            marks_df = st.session_state.df_final.copy()
+                            quiz_stats = run.get("class_quiz_stats")
+                            run.set(_df_final=st.session_state.df_final, coeffs=st.session_state.scale.loc["Coefficient"])
+                            marks_df = run.get("marks_df")
 
                             with st.expander(_("🎓 Individual analysis"), expanded=True):
                                 # 2. Student Selection
-                                marks_df['full_names'] = marks_df["name"] + " " + marks_df["firstname"]
                                 all_students = sorted(marks_df['full_names'].unique())
                                 st.session_state.all_students = all_students
                                 selected_student = st.selectbox("Select a student", all_students)
@@ -1542,6 +1655,9 @@ def main():
                                         value=True,
                                         key="fullCorrectionInAllReports",
                                     )
+                                    pdf_workers = st.number_input(_("Parallel workers (PDF)"), min_value=1, 
+                                                                  max_value=MAX_RENDER_WORKERS, 
+                                                                  value=MAX_RENDER_WORKERS, key="pdf_workers")
 
                                 if "zipped_pdf_reports" not in st.session_state:
                                     st.session_state.zipped_pdf_reports = None
@@ -1556,15 +1672,20 @@ def main():
                                             progress_bar.progress(p)
 
                                         with st.spinner(_("Generating zip...")):
+                                            # The previous archive of this session is replaced
+                                            remove_export(st.session_state.zipped_pdf_reports)
+                                            st.session_state.zipped_pdf_reports = None
                                             st.session_state.zipped_pdf_reports = generate_zip_report(
                                                 all_students, df_last, marks_df, quiz_stats, quiz, 
                                                 final_weights, st.session_state.fullCorrectionInAllReports, 
-                                                progress_callback=update_progress, pdf_output=True)
+                                                progress_callback=update_progress, pdf_output=True, workers=pdf_workers, 
+                                                output=new_export_file())
 
-                                    if st.session_state.zipped_pdf_reports is not None:
+                                    if st.session_state.zipped_pdf_reports is not None \
+                                            and os.path.exists(st.session_state.zipped_pdf_reports):
                                         st.download_button(
                                                 label=_("Download zip of all PDF reports"),
-                                                data=st.session_state.zipped_pdf_reports,
+                                                data=export_download_data(st.session_state.zipped_pdf_reports),
                                                 file_name="all_pdf_reports.zip",
                                                 mime="application/zip"
                                             )
@@ -1575,15 +1696,20 @@ def main():
                                             progress_bar.progress(p)
 
                                         with st.spinner(_("Generating zip...")):
+                                            # The previous archive of this session is replaced
+                                            remove_export(st.session_state.zipped_html_reports)
+                                            st.session_state.zipped_html_reports = None
                                             st.session_state.zipped_html_reports = generate_zip_report(
                                                 all_students, df_last, marks_df, quiz_stats, quiz, 
                                                 final_weights, st.session_state.fullCorrectionInAllReports, 
-                                                progress_callback=update_progress,  pdf_output=False)
+                                                progress_callback=update_progress, pdf_output=False, 
+                                                output=new_export_file())
                                             
-                                    if st.session_state.zipped_html_reports is not None:
+                                    if st.session_state.zipped_html_reports is not None \
+                                            and os.path.exists(st.session_state.zipped_html_reports):
                                         st.download_button(
                                                 label=_("Download zip of all HTML reports"),
-                                                data=st.session_state.zipped_html_reports,
+                                                data=export_download_data(st.session_state.zipped_html_reports),
                                                 file_name="all_html_reports.zip",
                                                 mime="application/zip"
                                             )
@@ -1594,6 +1720,9 @@ def main():
 
         except Exception as e:
             st.error(_('Error during reading or processing: ') + f"{e}")
+        if show_recomputed:
+            with st.sidebar:
+                show_dataflow(dataflow_run())
     else:
         st.warning(_("Please enter URL and SECRET in the sidebar, and load a quiz file."))
 
@@ -0,0 +1,431 @@
+import os
+import re
+import copy
+import time
+import tempfile
+import threading
+import multiprocessing
+from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import markdown
+import streamlit as st
+from packaging.version import Version
+
+from labquiz.utils import calculate_quiz_score
+from i18n import get_translator
+
+
+# CSS for PDF exports
+pdf_css = """
+@page {
+    size:A4;
+    page-size: A4;
+    margin: 2.5cm;
+    /* Footer area for numbering */
+    @bottom-right {
+        content: "Page " counter(page) "/" counter(pages);
+        font-family: "Liberation Serif", serif;
+        font-size: 9pt;
+        color: #555;
+    }
+}
+
+body {
+    font-family: "Liberation Serif", "Times New Roman", serif;
+    font-size: 11pt;
+    line-height: 1.4;
+    color: black;
+}
+
+/* Title hierarchy */
+h1 {
+    font-size: 14pt;
+    font-weight: bold;
+    text-transform: uppercase;
+    margin-bottom: 0.5cm;
+}
+
+h2 {
+    font-size: 12pt;
+    font-weight: bold;
+    margin-top: 0.4cm;
+    margin-bottom: 0.2cm;
+    border-bottom: 0.5pt solid #ccc; /* Small discreet line to separate sections */
+}
+
+h3 {
+    font-size: 11pt; /* Same size as body, but bold/italic */
+    font-weight: bold;
+    font-style: italic;
+    margin-top: 0.3cm;
+    margin-bottom: 0.1cm;
+}
+
+/* Handling intelligent page breaks */
+h1, h2, h3 {
+    page-break-after: avoid; /* Avoid a title being alone at the bottom of the page */
+}
+"""
+
+
+def natural_key(string_): #Gemini
+    """Splits the string into a list of strings and integers."""
+    return [int(s) if s.isdigit() else s.lower() for s in re.split(r'(\d+)', string_)]
+
+@lru_cache(maxsize=4096)
+def markdown_to_safe_html(text):
+    text = text.replace("&lt;br&gt;", "<br>")
+    # Conversion Markdown → HTML
+    html_output = markdown.markdown(
+        text,
+        extensions=["extra", "sane_lists"]
+    ).replace("<p>", "").replace("</p>", "")
+    return html_output
+
+def generate_pdf_report(html):
+    from io import BytesIO
+    from weasyprint import HTML, CSS
+
+    buffer = BytesIO()
+    HTML(string=html).write_pdf(target=buffer, stylesheets=[CSS(string=pdf_css)])
+    pdf_bytes = buffer.getvalue()
+    return pdf_bytes #HTML(string=html).write_pdf()
+
+
+# Header (MathJax and CSS) of the HTML reports, the same for all the students
+REPORT_HEADER = """
+    <html>
+    <head>
+    <script>
+    window.MathJax={tex:{inlineMath:[['$','$']],displayMath:[['$$','$$']]}};
+    </script>
+    <script src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-chtml.js"></script>
+
+    <style>
+    body{font-family:Arial,sans-serif;margin:40px}
+    h1{border-bottom:2px solid #444;padding-bottom:5px}
+    .indent{margin-left:20px}
+    .question{margin-top:25px;padding:15px;border:1px solid #ddd;border-radius:8px;background:#fafafa}
+    .prop{margin-left:10px;margin-top:4px}
+
+    .correct,.incorrect,.missed{font-weight:bold}
+    .correct{color:green}
+    .incorrect{color:red}
+    .missed{color:orange}
+
+    .checkbox{font-family:monospace;margin-right:6px}
+
+    .prop-row{display:flex;gap:10px;margin:4px 0 4px 20px}
+    .col-checkbox{width:30px;font-family:monospace}
+    .col-text{flex:1}
+    .col-status{width:50px;font-weight:bold}
+    .col-mark{width:50px;text-align:right}
+
+    @page{size:A4;margin:10mm}
+    </style>
+    </head>
+    <body>
+        """
+
+REPORT_TITLE = """<h1>{Report_for} {student_name}</h1>
+            <p><b>{info_marks}</b></p>
+            <p></p>
+            <p>{scale_str} {scale}</p>
+            """
+
+REPORT_SEPARATOR = '<hr style="border: none; border-top: 2px solid #000; margin: 20px 0;">'
+
+QUESTION_TEMPLATE = """
+                <p></p> <h3 style="display: inline;">{q} - </h3>
+                <span> <em>{question}</em> </span> 
+                """
+
+MCQ_ROW = """
+                        <div class="prop-row">
+                            <div class="col-checkbox">{checkbox}</div>
+                            <div class="col-text">{propal}</div>
+                            <div class="col-status">{Res}</div>
+                            <div class="col-mark">{mark}</div>
+                        </div>
+                            """
+
+MCQ_SUMMARY = """
+                    <div class="prop-row">
+                        {correct_str} {correct} - {incorrect_str} {incorrect}</div>
+                    </div>
+                        """
+
+NUMERIC_ROW = """
+                        <div class="prop-row indent">
+                            <div class="col-checkbox">{checkbox}</div>
+                            <div class="col-text">{propal}</div>
+                            <div class="col-status">{Res}</div>
+                            <div class="col-mark">{mark}</div>
+                        </div>
+                            """
+
+NUMERIC_SUMMARY = """
+                    <div class="prop-row indent">
+                        {correct_str} {correct} - {incorrect_str} {incorrect}</div>
+                        <div class="col-mark"></div>
+                    </div>
+                        """
+
+REPORT_END = """
+                    </body>
+                    </html>"""
+
+
+def scale_table_html(bareme, block_size=12):
+    """HTML of the scale table, split in blocks of block_size quizzes."""
+    n_cols = bareme.shape[1]
+    bareme_html = ""
+    for i in range(0, n_cols, block_size):
+        sub_df = bareme.iloc[:, i:i+block_size]
+        bareme_html += "<br>" + sub_df.to_html(index=True, float_format='{:.2f}'.format, classes='table table-bordered', border=1)
+    return bareme_html
+
+def is_template(quiz_type):
+    return quiz_type.endswith('-template')
+
+def compile_report(list_quizzes, quiz_bank, bareme):
+    """
+    Student-independent parts of the reports, rendered once for the whole class: 
+    scale table, and the question and propositions HTML of each quiz. Template quizzes, 
+    whose text depends on each student's context, are rendered per student.
+    """
+    quizzes = {}
+    for q in list_quizzes:
+        current_quiz = quiz_bank[q]  # Propositions already sorted on labels (build_quiz)
+        if is_template(current_quiz['type']):
+            continue
+        quizzes[q] = {
+            "question": QUESTION_TEMPLATE.format(q=q, question=markdown_to_safe_html(current_quiz['question'])),
+            "propositions": [markdown_to_safe_html(prop['proposition']) for prop in current_quiz['propositions']],
+        }
+    return {"scale": scale_table_html(bareme), "quizzes": quizzes}
+
+
+def make_individual_report(selected_student, list_quizzes, student_data, quiz_bank, final_weights, bareme, 
+                           FinalMarkScale, class_mean, class_std, fullCorrection=True, lang_func=None, 
+                           compiled=None):
+    """
+    HTML correction report of one student. Only uses the student's own rows 
+    (student_data), so that reports can be rendered in worker processes.
+    `compiled` is the output of compile_report, shared by all the students of the class.
+    """
+    _ = lang_func if lang_func else lambda x: x
+    if compiled is None:
+        compiled = compile_report(list_quizzes, quiz_bank, bareme)
+    FinalMark = student_data.loc[:, 'FinalMark'].mean()*FinalMarkScale/20
+
+    info_marks = _("Final mark: {FinalMark:.2f} / {FinalMarkScale} -- Class mean: {class_mean:.2f} & Standard deviation: {class_std:.2f}").format(FinalMark=FinalMark, 
+                                        FinalMarkScale=FinalMarkScale, 
+                                        class_mean=class_mean, class_std=class_std)
+
+    html = [REPORT_HEADER]
+    html.append(REPORT_TITLE.format(Report_for=_("Correction for"), scale_str=_("Scale:"), 
+                                    scale=compiled["scale"], student_name=selected_student, info_marks=info_marks))
+    html.append(REPORT_SEPARATOR)
+    correct_str, incorrect_str = _("Correct"), _("Incorrect")
+
+    for q in list_quizzes:
+        current_quiz = quiz_bank[q]
+        fragments = compiled["quizzes"].get(q)
+        if fragments is None:
+            # Template quiz: instantiated with the student's context, on a copy of the bank entry
+            current_quiz = copy.deepcopy(current_quiz)
+        propositions = current_quiz['propositions']
+        constraints = current_quiz.get('constraints', {})
+        quiz_type = current_quiz['type']
+
+        try: 
+            user_answers = student_data.loc[q, 'answers']
+            user_answers = {k:user_answers[k] for k in sorted(user_answers)} # sort on keys (shoul be already sorted, but security)
+        except:
+            user_answers = {}
+        
+        score, total_possible, details = calculate_quiz_score(quiz_type, user_answers, propositions, 
+                    question=current_quiz['question'], weights=final_weights, constraints=constraints, return_details=True)
+
+        propositions = details['propositions']
+        marks = details['marks']
+        violations = details['violations'] 
+        if fragments is None:
+            fragments = {
+                "question": QUESTION_TEMPLATE.format(q=q, question=markdown_to_safe_html(details['question'])),
+                "propositions": [markdown_to_safe_html(prop['proposition']) for prop in propositions],
+            }
+        html.append(fragments["question"])
+
+        if len(user_answers) == 0:
+            html.append("<p class='indent'>{no_answer}</p>".format(no_answer=_("No answer")))
+            continue
+        
+        answererd_at = _("Answered at: ") + student_data.loc[q, 'timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+        html.append("<p class='indent'>{answererd_at}</p>".format(answererd_at=answererd_at))
+
+        mcq = 'mcq' in quiz_type
+        if fullCorrection:
+            for prop, propal in zip(propositions, fragments["propositions"]):
+                answer = user_answers.get(prop['label'], '')
+                mark = float(marks.get(prop['label'], 0))
+                if mcq:
+                    checkbox = "✅" if answer else "⬜"
+                    Res = correct_str if answer == prop['expected'] else incorrect_str
+                    html.append(MCQ_ROW.format(checkbox=checkbox, propal=propal, Res=Res, mark=mark))
+                else:
+                    Res = incorrect_str if mark == 0 else correct_str
+                    html.append(NUMERIC_ROW.format(checkbox=answer, propal=propal, Res=Res, mark=mark))
+        else:
+            correct = sum([user_answers.get(prop['label'], '') == prop['expected'] for prop in propositions])
+            incorrect = len(propositions) - correct
+            html.append((MCQ_SUMMARY if mcq else NUMERIC_SUMMARY).format(
+                correct=correct, correct_str=correct_str, incorrect=incorrect, incorrect_str=incorrect_str))
+        
+        if len(violations) > 0:
+            html.append("<h3>" + _("Logical Contraints Violations: ") + "</h3>")
+            html.append("<div class='indent'>")
+            for key in violations:
+                if fullCorrection:
+                    html.append(_("{key}: Violation between {indexes} - Malus:{malus}").format(key=key, 
+                                    indexes=violations[key]['indexes'], malus=violations[key]['malus']))
+                else:
+                    html.append(_("Violation {key}: Malus:{malus}").format(key=key, malus=violations[key]['malus']))
+            html.append("</div>")
+
+        # Final score
+        score_obtained = "Score obtained:  {score} / {total_possible} = {normalized_score:.2f} (class average: {class_avg:.2f} with std: {class_std:.2f})".format(
+                    score=score, total_possible=total_possible, normalized_score=score/total_possible,
+                    class_std=student_data.loc[q, 'std'], class_avg=student_data.loc[q, 'mean'] )
+        html.append("<br>" + score_obtained)
+        html.append(REPORT_END)
+
+    return "".join(html)
+
+
+# Columns of student_data used by make_individual_report
+REPORT_COLUMNS = ['answers', 'timestamp', 'FinalMark', 'mean', 'std']
+
+# Report settings of the pool worker processes (set once per process, never in the server)
+_worker_context = {}
+
+def render_context(context):
+    """Report settings shared by all the students, with the translator and the compiled quiz-level HTML."""
+    c = dict(context)
+    c["lang_func"] = get_translator(context["lang"])
+    # Quiz-level HTML, rendered once for all the students
+    c["compiled"] = compile_report(context["list_quizzes"], context["quiz_bank"], context["bareme"])
+    return c
+
+def _init_worker(context):
+    _worker_context.update(render_context(context))
+
+def render_student_report(student, student_data, pdf_output=True, context=None):
+    """
+    Renders the report of one student, returns (student, html or pdf bytes). Without a
+    context (see render_context), the one of the worker process is used.
+    """
+    c = context if context is not None else _worker_context
+    html = make_individual_report(student, c["list_quizzes"], student_data, c["quiz_bank"], 
+                                  c["final_weights"], c["bareme"], c["FinalMarkScale"], 
+                                  c["class_mean"], c["class_std"], fullCorrection=c["fullCorrection"], 
+                                  lang_func=c["lang_func"], compiled=c["compiled"])
+    return student, generate_pdf_report(html) if pdf_output else html
+
+# Report rendering processes started at once by all the sessions of the server
+MAX_RENDER_WORKERS = min(4, os.cpu_count() or 1)
+_render_slots = {"free": MAX_RENDER_WORKERS}
+_render_lock = threading.Lock()
+
+def _reserve_workers(wanted):
+    # Worker processes granted to an export, within those left by the concurrent exports
+    with _render_lock:
+        granted = min(wanted, _render_slots["free"])
+        if granted > 1:
+            _render_slots["free"] -= granted
+            return granted
+        return 1
+
+def _release_workers(granted):
+    if granted > 1:
+        with _render_lock:
+            _render_slots["free"] += granted
+
+def render_reports(tasks, total, context, workers=None, pdf_output=True, progress_callback=None):
+    """
+    Renders the reports of the (student, student_data) tasks, yielding (student, content) 
+    as they are finished. With more than one worker, the rendering is spread over a 
+    pool of processes; progress is reported on completed reports, whatever their order.
+    All the exports of the process share MAX_RENDER_WORKERS workers: an export started 
+    while the others use them all is rendered here, without a pool.
+    """
+    workers = _reserve_workers(min(workers or MAX_RENDER_WORKERS, total))
+    try:
+        yield from _render_reports(tasks, total, context, workers, pdf_output, progress_callback)
+    finally:
+        _release_workers(workers)
+
+def _render_reports(tasks, total, context, workers, pdf_output, progress_callback):
+    if workers <= 1:
+        # Local settings: concurrent exports of other sessions run in the same process
+        local_context = render_context(context)
+        for k, (student, student_data) in enumerate(tasks):
+            yield render_student_report(student, student_data, pdf_output, context=local_context)
+            if progress_callback:
+                progress_callback((k + 1) / total)
+        return
+
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, 
+                             initializer=_init_worker, initargs=(context,)) as pool:
+        # Tasks are submitted as soon as they are prepared, with only the needed columns
+        futures = [pool.submit(render_student_report, student, student_data[REPORT_COLUMNS], pdf_output) 
+                   for student, student_data in tasks]
+        for k, future in enumerate(as_completed(futures)):
+            yield future.result()
+            if progress_callback:
+                progress_callback((k + 1) / total)
+
+
+# Zip exports are written to disk and served from there, never kept in memory
+EXPORT_DIR = Path(tempfile.gettempdir()) / "quiz_dash_exports"
+EXPORT_MAX_AGE = 6 * 3600  # seconds
+# From streamlit 1.52, download_button accepts a callable, only read when the button is clicked
+DEFERRED_DOWNLOAD = Version(st.__version__) >= Version("1.52")
+
+def cleanup_exports(max_age=EXPORT_MAX_AGE):
+    """Removes the export files older than max_age seconds."""
+    if not EXPORT_DIR.exists():
+        return
+    limit = time.time() - max_age
+    for f in EXPORT_DIR.iterdir():
+        try:
+            if f.stat().st_mtime < limit:
+                f.unlink()
+        except OSError:
+            pass
+
+def new_export_file(suffix=".zip"):
+    """Path of a new (empty) export file, after removing the expired ones."""
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    cleanup_exports()
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=EXPORT_DIR)
+    os.close(fd)
+    return path
+
+def remove_export(path):
+    if path is not None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+def export_download_data(path):
+    """`data` for st.download_button, read from disk (on click only, if supported)."""
+    if DEFERRED_DOWNLOAD:
+        return lambda: Path(path).read_bytes()
+    return Path(path).read_bytes()
+
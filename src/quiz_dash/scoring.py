@@ -0,0 +1,367 @@
+import numpy as np
+import pandas as pd
+
+from labquiz.putils import correct_ans, getExamQuestions
+
+from ingest import FILTERED_EVENTS
+
+
+# Same defaults and exclusions as labquiz (utils.calculate_quiz_score, putils.getAllStudentsAnsvers)
+DEFAULT_WEIGHTS = {(True, True): 1.0, (True, False): -1.0, (False, True): 0.0, (False, False): 0.0}
+IGNORED_QUIZZES = ["0", "integrity"]
+NUMBER_TYPES = (int, float, np.integer, np.floating)
+
+
+def selected_answers(data, students, maxtries=3):
+    """
+    Answer kept for the correction of each (student, quiz), selected as labquiz.putils.check_ans
+    does (last attempt before the correction was shown, at most the attempt of rank maxtries).
+    Returns a dataframe with the columns student, quiz_title and answers.
+    """
+    events = data[data["event_type"].isin(FILTERED_EVENTS) & data["student"].isin(list(students))
+                  & ~data["quiz_title"].isin(IGNORED_QUIZZES)]
+    events = events.dropna(subset=["student", "quiz_title"])
+    keys = [events["student"], events["quiz_title"]]
+    pos = events.groupby(keys, sort=False, observed=True).cumcount()
+    size = pos.groupby(keys, sort=False, observed=True).transform("size")
+    first_correction = pos.where(events["event_type"].eq("correction")).groupby(keys, sort=False, observed=True).transform("min")
+    idx = np.where(first_correction.notna(),
+                   np.where(first_correction - 1 <= maxtries, first_correction - 1, maxtries),
+                   np.where(size <= maxtries, size - 1, maxtries))
+    return events.loc[(pos == idx).to_numpy(), ["student", "quiz_title", "answers"]]
+
+
+def reference_score(quiz, quiz_id, given, weights, student=""):
+    """Score of one answer with labquiz (as in labquiz.putils.correctAll)."""
+    score, score_max = 0, 1
+    try:
+        score, score_max = correct_ans(quiz, quiz_id, given, weights=weights)
+        if score_max == 0: raise ValueError("score_max = 0...")
+    except Exception as e:
+        print(f"Error correcting student {student}, quiz_id={quiz_id}", e)
+    return score/score_max
+
+
+# Cases of the weights matrix, in the order of the confusion counts
+CASES = [(True, True), (True, False), (False, True), (False, False)]   # TP, FP, FN, TN
+
+
+class QuizScorer:
+    """
+    One quiz compiled to arrays (expected values, points, tolerances, constraints), to score
+    the answers of all the students at once with the rules of labquiz.utils.calculate_quiz_score.
+    The compiled quiz does not depend on the weights matrix, only applied when scoring.
+    """
+
+    def __init__(self, quiz_type, labels, props, rules):
+        self.quiz_type = quiz_type
+        self.labels = labels
+        self.props = props   # Normalized propositions, sorted by label
+        self.rules = rules   # (position 1, position 2, type, abs(malus)) of the mcq constraints
+        mcq = quiz_type == "mcq"
+        self.expected = np.array([p["expected"] if mcq else float(p["expected"]) for p in props], 
+                                 dtype=bool if mcq else float)
+        # Propositions graded with the weights matrix when answered correctly / incorrectly
+        self.global_correct = np.array([mcq and 'weights' not in p and "correctAnswerPoints" not in p for p in props])
+        self.global_incorrect = np.array([mcq and 'weights' not in p and "incorrectAnswerPoints" not in p for p in props])
+
+    @classmethod
+    def compile(cls, quiz, quiz_id):
+        """Returns the scorer of the quiz, or None if it must be corrected answer by answer (templates...)."""
+        try:
+            _, quiz_type, propositions, constraints = quiz._QuizLab__load_quiz(quiz_id)
+            props = [cls._normalize(p) for p in sorted(propositions, key=lambda d: d["label"])]
+            if quiz_type == "qcm": quiz_type = "mcq"
+            if quiz_type == "mcq":
+                cls._check_mcq(props)
+            elif quiz_type == "numeric":
+                cls._check_numeric(props)
+            else:
+                return None
+            labels = [p["label"] for p in props]
+            rules = cls._compile_rules(constraints, labels) if quiz_type == "mcq" else []
+            if rules is None:
+                return None
+            return cls(quiz_type, labels, props, rules)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _normalize(prop):
+        # Old key names of the YAML structure (renamed in place by calculate_quiz_score)
+        prop = dict(prop)
+        for old, new in (("reponse", "answer"), ("bonus", "correctAnswerPoints"), ("malus", "incorrectAnswerPoints")):
+            if old in prop:
+                prop[new] = prop.pop(old)
+        return prop
+
+    @staticmethod
+    def _prop_weights(prop):
+        pweights = prop['weights']
+        return {(True, True): pweights.get("(True, True)", 1.0), (True, False): pweights.get("(True, False)", -1.0),
+                (False, True): pweights.get("(False, True)", 0.0), (False, False): pweights.get("(False, False)", 0.0)}
+
+    @classmethod
+    def _check_mcq(cls, props):
+        for prop in props:
+            if not isinstance(prop.get("expected", None), (bool, np.bool_)):
+                raise ValueError("Non boolean expected value")
+            points = [prop.get("correctAnswerPoints", 0), prop.get("incorrectAnswerPoints", 0)]
+            if 'weights' in prop:
+                points += list(cls._prop_weights(prop).values())
+            if not all(isinstance(v, NUMBER_TYPES) for v in points):
+                raise ValueError("Non numeric points")
+
+    @classmethod
+    def _check_numeric(cls, props):
+        for prop in props:
+            if prop.get("expected", None) is None:
+                raise ValueError("Missing expected value")
+            if 'weights' in prop:
+                cls._prop_weights(prop)   # Fails as in labquiz if malformed
+            float(prop["expected"])
+            values = (prop.get("correctAnswerPoints", 1), prop.get("incorrectAnswerPoints", 0), 
+                      prop.get("tolerance_abs", 0), prop.get("tolerance", 0.01))
+            if not all(isinstance(v, NUMBER_TYPES) for v in values):
+                raise ValueError("Non numeric points or tolerance")
+
+    @staticmethod
+    def _compile_rules(constraints, labels):
+        rules = []
+        for rule in constraints:
+            try:
+                idx1, idx2 = rule["indexes"]
+                malus = rule.get("malus", 1)
+            except Exception:
+                continue
+            if idx1 not in labels or idx2 not in labels:
+                continue   # Ignored by labquiz (missing answer)
+            r_type = rule.get("type", "XOR")
+            if not isinstance(r_type, str) or not isinstance(malus, NUMBER_TYPES):
+                return None
+            rules.append((labels.index(idx1), labels.index(idx2), r_type.upper(), abs(malus)))
+        return rules
+
+    def points(self, weights=None):
+        """Points of each proposition answered correctly / incorrectly, and the total possible."""
+        weights = weights or DEFAULT_WEIGHTS
+        correct, incorrect = [], []
+        total_possible = 0.0
+        for prop in self.props:
+            if self.quiz_type == "mcq":
+                exp = bool(prop["expected"])
+                w = self._prop_weights(prop) if 'weights' in prop else weights
+                val_correct = prop.get("correctAnswerPoints", w[(exp, exp)])
+                val_incorrect = prop.get("incorrectAnswerPoints", w[(not exp, exp)])
+            else:
+                val_correct = prop.get("correctAnswerPoints", 1)
+                val_incorrect = prop.get("incorrectAnswerPoints", 0)
+            total_possible += val_correct
+            correct.append(val_correct)
+            incorrect.append(val_incorrect)
+        return np.array(correct, dtype=float), np.array(incorrect, dtype=float), total_possible
+
+    def matrix(self, answers):
+        """
+        Answers as a (students x propositions) array, with a mask of the answers that can be
+        scored here (keys identical to the labels, values of the expected kind).
+        """
+        mcq = self.quiz_type == "mcq"
+        values = np.zeros((len(answers), len(self.labels)), dtype=bool if mcq else float)
+        ok = np.zeros(len(answers), dtype=bool)
+        for i, given in enumerate(answers):
+            try:
+                if not isinstance(given, dict) or sorted(given) != self.labels:
+                    continue
+                row = [given[label] for label in self.labels]
+                if mcq:
+                    values[i] = [bool(v) for v in row]
+                elif all(isinstance(v, NUMBER_TYPES) for v in row):
+                    values[i] = row
+                else:
+                    continue
+            except Exception:
+                continue
+            ok[i] = True
+        return values, ok
+
+    def correct_mask(self, values):
+        """Propositions answered correctly."""
+        if self.quiz_type == "mcq":
+            return values == self.expected
+        tolerance = [max(p.get("tolerance_abs", 0), p.get("tolerance", 0.01) * abs(float(p["expected"])))
+                     for p in self.props]
+        return np.abs(values - self.expected) <= np.array(tolerance, dtype=float)
+
+    def violations(self, values):
+        """(violated, malus) of each constraint."""
+        for i1, i2, r_type, malus in self.rules:
+            ans1, ans2 = values[:, i1], values[:, i2]
+            if r_type == "XOR":
+                yield ans1 == ans2, malus
+            elif r_type == "IMPLY":
+                yield ans1 & ~ans2, malus
+            elif r_type == "IMPLYFALSE":
+                yield ans1 & ans2, malus
+            elif r_type == "SAME":
+                yield ans1 != ans2, malus
+
+    def score(self, values, weights=None):
+        """Normalized scores (score / total possible), computed exactly as labquiz does."""
+        correct, incorrect, total_possible = self.points(weights)
+        marks = np.where(self.correct_mask(values), correct, incorrect)
+        # Summed proposition by proposition, in the same order as labquiz (same rounding)
+        score = np.zeros(len(values))
+        for j in range(marks.shape[1]):
+            score = score + marks[:, j]
+        for violated, malus in self.violations(values):
+            score = np.where(violated, score - malus, score)
+        if total_possible == 0:
+            return np.full(len(values), np.nan)   # Left to labquiz (error)
+        return score / total_possible
+
+    def counts(self, values):
+        """
+        Confusion counts (TP, FP, FN, TN) of the propositions graded with the weights matrix,
+        points that do not depend on it, and constraint maluses, for each answer. Also returns
+        the counts and fixed points of the total possible.
+        """
+        correct = self.correct_mask(values)
+        gc, gi = self.global_correct, self.global_incorrect
+        counts = np.zeros((len(values), 4))
+        if self.quiz_type == "mcq":
+            exp = self.expected
+            counts[:, 0] = (values & exp & gc).sum(axis=1)
+            counts[:, 1] = (values & ~exp & gi).sum(axis=1)
+            counts[:, 2] = (~values & exp & gi).sum(axis=1)
+            counts[:, 3] = (~values & ~exp & gc).sum(axis=1)
+        fixed_correct, fixed_incorrect, _ = self.points()
+        fixed = np.where(correct, np.where(gc, 0.0, fixed_correct), np.where(gi, 0.0, fixed_incorrect)).sum(axis=1)
+        malus = np.zeros(len(values))
+        for violated, rule_malus in self.violations(values):
+            malus = malus + np.where(violated, rule_malus, 0.0)
+        total_counts = np.zeros(4)
+        if self.quiz_type == "mcq":
+            total_counts[0] = (self.expected & gc).sum()
+            total_counts[3] = (~self.expected & gc).sum()
+        fixed_total = fixed_correct[~gc].sum()
+        return counts, fixed - malus, total_counts, fixed_total
+
+
+class ClassCorrection:
+    """
+    Answers of a class selected for the correction (as correctQuizzesDf does), compiled once
+    into answer matrices per quiz. For the answers that are linear in the weights matrix, the
+    per (student, quiz) confusion counts are kept, so that a change of weights is re-graded
+    with a matrix product; the other answers are re-corrected one by one with labquiz.
+    """
+
+    def __init__(self, data, data_filt, quiz, title=None, bareme=None, maxtries=1):
+        if title is None:
+            students = sorted(list(data_filt["student"].dropna().unique()))
+            exam_questions = None
+        else:
+            exam_questions = getExamQuestions(title, data)
+            students = list(exam_questions.keys())
+        self.quiz = quiz
+        self.students = students
+        self.exam_questions = exam_questions
+        self.bareme = bareme
+        self.allquizzes = [q for q in quiz.quiz_bank.keys() if q != "title"]
+        if bareme is not None:
+            self.marking_scheme = {q: 1 if q not in bareme.keys() else bareme[q] for q in self.allquizzes}
+        else:
+            self.marking_scheme = {q: 1 for q in self.allquizzes}
+
+        answers = selected_answers(data, students, maxtries=maxtries)
+        if exam_questions is None:
+            answers = answers[answers["quiz_title"].isin(self.allquizzes)]
+        else:
+            exam_sets = {s: set(questions) for s, questions in exam_questions.items()}
+            answers = answers[[q in exam_sets[s] for s, q in zip(answers["student"], answers["quiz_title"])]]
+        self.answers = answers[[not (isinstance(g, dict) and len(g) == 0) for g in answers["answers"]]]
+
+        given = self.answers["answers"].to_numpy()
+        n = len(self.answers)
+        self.blocks = []                          # (quiz_id, rows, scorer, values, ok) per quiz
+        self.linear = np.zeros(n, dtype=bool)     # Answers graded from their confusion counts
+        self.counts = np.zeros((n, 4))
+        self.fixed = np.zeros(n)
+        self.total_counts = np.zeros((n, 4))
+        self.fixed_total = np.zeros(n)
+        for quiz_id, rows in self.answers.groupby("quiz_title", sort=False, observed=True).indices.items():
+            scorer = QuizScorer.compile(quiz, quiz_id)
+            if scorer is None:
+                self.blocks.append((quiz_id, rows, None, None, np.zeros(len(rows), dtype=bool)))
+                continue
+            values, ok = scorer.matrix(given[rows])
+            self.blocks.append((quiz_id, rows, scorer, values, ok))
+            counts, fixed, total_counts, fixed_total = scorer.counts(values[ok])
+            kept = rows[ok]
+            self.linear[kept] = True
+            self.counts[kept], self.fixed[kept] = counts, fixed
+            self.total_counts[kept], self.fixed_total[kept] = total_counts, fixed_total
+
+    def scores(self, weights=None, exact=False):
+        """
+        Normalized score of each selected answer. With exact=True, scores are summed as labquiz 
+        does (same rounding); otherwise they come from the confusion counts.
+        """
+        scores = np.full(len(self.answers), np.nan)
+        if exact:
+            for quiz_id, rows, scorer, values, ok in self.blocks:
+                if scorer is not None and ok.any():
+                    try:
+                        scores[rows[ok]] = scorer.score(values[ok], weights)
+                    except Exception:
+                        pass   # e.g. incomplete weights matrix: left to labquiz
+        else:
+            w = np.array([(weights or DEFAULT_WEIGHTS)[case] for case in CASES], dtype=float)
+            total = self.total_counts @ w + self.fixed_total
+            with np.errstate(divide="ignore", invalid="ignore"):
+                scores = np.where(total != 0, (self.counts @ w + self.fixed) / total, 0.0)
+            scores[~self.linear] = np.nan
+        # Answers not handled on arrays
+        students = self.answers["student"].to_numpy()
+        given = self.answers["answers"].to_numpy()
+        for quiz_id, rows, *_ in self.blocks:
+            for i in rows[np.isnan(scores[rows])]:
+                scores[i] = reference_score(self.quiz, quiz_id, given[i], weights, student=students[i])
+        return scores
+
+    def grade(self, weights=None, seuil=0, exact=False):
+        """Results table of the class, as returned by correctQuizzesDf."""
+        students, allquizzes, marking_scheme = self.students, self.allquizzes, self.marking_scheme
+        Res = pd.DataFrame(np.nan, index=students, columns=allquizzes)
+        values = Res.to_numpy(copy=True)
+        values[Res.index.get_indexer(self.answers["student"]), 
+               Res.columns.get_indexer(self.answers["quiz_title"])] = self.scores(weights, exact=exact)
+        Res = pd.DataFrame(values, index=Res.index, columns=Res.columns)
+
+        exam_questions = {s: allquizzes for s in students} if self.exam_questions is None else self.exam_questions
+        maxpts = {}
+        for s in students:
+            key = tuple(exam_questions[s])
+            if key not in maxpts:
+                maxpts[key] = pd.Series([marking_scheme[q] for q in exam_questions[s]]).sum()
+        Res['maxpts'] = np.array([maxpts[tuple(exam_questions[s])] for s in students], dtype=float)
+
+        Res = Res.dropna(axis=1, how="all").fillna(0)
+        if seuil==0: Res[Res < 0] = 0
+        poids = pd.Series({q: marking_scheme[q] for q in Res.columns if q != 'maxpts'})
+        Res['Note'] = Res[poids.index].dot(poids) / Res['maxpts'] * 20
+
+        if self.bareme is not None:
+            colsToDrop = [quiz_id for quiz_id, val in self.bareme.items() if val==0 and quiz_id in Res.columns]
+            return Res.drop(columns=colsToDrop)
+        return Res
+
+
+def correct_quizzes(data, data_filt, quiz, title=None, seuil=0, weights=None, bareme=None, maxtries=1):
+    """
+    Same as labquiz.putils.correctQuizzesDf (same arguments, same results), but the answers to
+    each quiz are scored for the whole class at once on arrays. Answers that the array engine
+    does not handle (templates, unusual propositions) are corrected one by one with labquiz.
+    """
+    correction = ClassCorrection(data, data_filt, quiz, title=title, bareme=bareme, maxtries=maxtries)
+    return correction.grade(weights, seuil=seuil, exact=True)
@@ -0,0 +1,160 @@
+import os
+import re
+import time
+from io import StringIO
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+import requests
+
+from event_store import EventStore, sheet_key
+
+
+# Sources are given in the URL field:
+#   https://script.google.com/...                  live Google Sheet (needs the secret)
+#   file:///path/to/dir_or_file                    local CSV / Parquet / SQLite event store
+#   replay:///path/to/recording?speed=10           timed replay of a recording
+# Several sources (e.g. one sheet per lab room) can be given, separated by spaces, new
+# lines or ';': they are read concurrently and merged (ingest.MultiEventLog).
+# Setting QUIZ_DASH_RECORD=/some/dir records every sheet fetch to that directory.
+RECORD_FILE = "events.csv"
+RECORD_TIME = "_recorded_at"
+# Time allowed to each sheet download (s)
+SOURCE_TIMEOUT = 30
+
+
+def split_urls(url):
+    """Sources given in the URL field."""
+    return [u for u in re.split(r"[\s;]+", url.strip()) if u]
+
+
+def is_sheet_url(url):
+    return urlparse(url).scheme in ("http", "https")
+
+
+def fetch_sheet_text(url, secret, timeout=SOURCE_TIMEOUT):
+    """Downloads the raw CSV export of the sheet (no parsing)."""
+    r = requests.get(url, params={"secret": secret}, timeout=timeout)
+    r.raise_for_status()
+    return r.text
+
+
+def read_local_events(path):
+    """Reads raw events from a CSV/Parquet file, a SQLite event store, or a directory of them."""
+    path = Path(path)
+    if path.is_dir():
+        files = sorted(p for p in path.iterdir() if p.suffix in (".csv", ".parquet", ".sqlite", ".db"))
+        frames = [read_local_events(p) for p in files]
+        frames = [f for f in frames if not f.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if path.suffix == ".csv":
+        return pd.read_csv(path)
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)  # needs pyarrow or fastparquet
+    if path.suffix in (".sqlite", ".db"):
+        store = EventStore(path)
+        frames = [store.load(sheet) for sheet in store.sheets()]
+        frames = [f for f in frames if not f.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    raise ValueError(f"Unsupported event file: {path}")
+
+
+class SheetSource:
+    """Live Google Sheet, read through the LabQuiz Apps Script endpoint."""
+
+    def __init__(self, url, secret):
+        self.url = url
+        self.secret = secret
+        self.key = sheet_key(url)
+
+    def fetch(self):
+        return fetch_sheet_text(self.url, self.secret)
+
+
+class LocalSource:
+    """Events read from local files (the whole content is returned at each fetch)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.key = sheet_key("file://" + str(Path(path).resolve()))
+
+    def fetch(self):
+        raw = read_local_events(self.path)
+        return raw.drop(columns=[c for c in raw.columns if c.startswith("_")])
+
+
+class RecordingSource:
+    """Wraps a source and appends every new row it returns to `directory/events.csv`."""
+
+    def __init__(self, source, directory):
+        self.source = source
+        self.key = source.key
+        self.file = Path(directory) / RECORD_FILE
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        self.n_recorded = len(pd.read_csv(self.file, usecols=[RECORD_TIME])) if self.file.exists() else 0
+
+    def fetch(self):
+        data = self.source.fetch()
+        raw = pd.read_csv(StringIO(data)) if isinstance(data, str) else data
+        new = raw.iloc[self.n_recorded:].copy()
+        if len(new):
+            new[RECORD_TIME] = time.time()
+            new.to_csv(self.file, mode="a", header=not self.file.exists(), index=False)
+            self.n_recorded = len(raw)
+        return data
+
+
+class ReplaySource:
+    """
+    Replays a recording as a timed event stream. The replay clock starts at the
+    first fetch and runs `speed` times faster than real time; each fetch returns
+    the events whose (recorded) time has been reached.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = float(speed)
+        self.key = sheet_key(f"replay://{Path(path).resolve()}?speed={speed}")
+        raw = read_local_events(path)
+        self.events, self.times = self._timeline(raw)
+        self.started = None
+
+    @staticmethod
+    def _timeline(raw):
+        # Event timestamps when readable, otherwise the time the row was recorded
+        times = pd.to_datetime(raw["timestamp"].astype(str).str.split(r' \(').str[0],
+                               errors="coerce", utc=True)
+        seconds = (times - pd.Timestamp(0, tz="UTC")).dt.total_seconds()
+        if RECORD_TIME in raw.columns:
+            seconds = seconds.fillna(raw[RECORD_TIME])
+        seconds = seconds.ffill().fillna(0)
+        order = seconds.sort_values(kind="mergesort").index
+        events = raw.loc[order].reset_index(drop=True)
+        events = events.drop(columns=[c for c in events.columns if c.startswith("_")])
+        return events, seconds.loc[order].to_numpy()
+
+    def fetch(self):
+        now = time.time()
+        if self.started is None:
+            self.started = now
+        if len(self.times) == 0:
+            return self.events
+        clock = self.times[0] + (now - self.started) * self.speed
+        n = int((self.times <= clock).sum())
+        return self.events.iloc[:n]
+
+
+def make_source(url, secret=""):
+    """Builds the event source designated by `url` (see the schemes above)."""
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return LocalSource(parsed.path)
+    if parsed.scheme == "replay":
+        speed = parse_qs(parsed.query).get("speed", ["1"])[0]
+        return ReplaySource(parsed.path, speed=speed)
+    source = SheetSource(url, secret)
+    record_dir = os.environ.get("QUIZ_DASH_RECORD")
+    if record_dir:
+        source = RecordingSource(source, record_dir)
+    return source
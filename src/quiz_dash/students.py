@@ -0,0 +1,66 @@
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+STUDENT_FIELDS = ['name', 'firstname', 'class_group']
+SEPARATOR = re.compile(r'\s*,\s*')
+
+
+def display_name(student):
+    """'NAME Firstname' of a 'name, firstname, group' string (unchanged if there is no firstname)."""
+    parts = student.split(',')
+    return parts[0].strip().upper() + ' ' + parts[1].strip().title() if len(parts) > 1 else student
+
+
+class StudentRegistry:
+    """
+    Identities of the students seen so far: each distinct student string gets an integer
+    id, and is parsed once into name, firstname, group and display name. Ids are stable,
+    the registry only grows (the event log is append-only): the owner replaces it when it
+    gets too large (see quiz_dash.get_student_registry). Thread-safe.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.parts = []
+        self.display = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.parts)
+
+    def register(self, students):
+        """Integer ids of the given student strings (-1 for missing values)."""
+        codes, uniques = pd.factorize(np.asarray(students, dtype=object))
+        with self._lock:
+            for student in uniques:
+                if student not in self.ids:
+                    self.ids[student] = len(self.parts)
+                    self.parts.append(tuple(SEPARATOR.split(student)))
+                    self.display.append(display_name(student))
+            unique_ids = np.array([self.ids[s] for s in uniques], dtype=np.int64)
+        if not len(unique_ids):
+            return np.full(len(codes), -1, dtype=np.int64)
+        return np.where(codes >= 0, unique_ids[codes], -1)
+
+    def fields(self, ids):
+        """Columns name, firstname, class_group (as far as the strings have parts) of the given ids."""
+        present = np.unique(ids[ids >= 0])
+        with self._lock:
+            n_fields = min(max((len(self.parts[i]) for i in present), default=1), len(STUDENT_FIELDS))
+            table = np.full((len(self.parts) + 1, n_fields), None, dtype=object)
+            for i in present:
+                parts = self.parts[i][:n_fields]
+                table[i, :len(parts)] = parts
+        # Missing students (id -1) read the last row, all None
+        return {field: table[ids, k] for k, field in enumerate(STUDENT_FIELDS[:n_fields])}
+
+    def display_names(self, students):
+        """Display names of the given student strings."""
+        ids = self.register(students)
+        with self._lock:
+            display = np.array(self.display + [None], dtype=object)
+        return display[ids]
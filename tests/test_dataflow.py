@@ -0,0 +1,79 @@
+"""
+Regression tests of the derived artifacts of the dashboard (dataflow.py, quiz_dash.ARTIFACTS).
+Run with: python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "benchmarks"))
+sys.path.insert(0, str(HERE.parent / "src" / "quiz_dash"))
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+
+import synthetic
+import quiz_dash as qd
+from dataflow import Dataflow
+
+
+WEIGHTS = {(True, True): 1.0, (True, False): -1.0, (False, True): 0.0, (False, False): 0.0}
+
+
+def results(n_students=30, seed=0):
+    # Results table of a class, as set in df_final by the correction
+    rng = np.random.default_rng(seed)
+    students = [f"Name{k:05d}, First{k:05d}, G{k % 3 + 1}" for k in range(n_students)]
+    df_final = pd.DataFrame({"student": students, "q1": rng.random(n_students), "q2": rng.random(n_students)})
+    df_final = qd.generate_cols_from_student(df_final)
+    df_final["FinalMark"] = 0.0
+    return df_final
+
+
+def regrade(df_final, group, coeffs=(1.0, 2.0), version=("v", 1)):
+    # Steps of the Correction & Grades tab, for one rerun
+    run = Dataflow().run(qd.ARTIFACTS)
+    st.session_state.dataflow_run = run
+    st.session_state.df_final = df_final
+    events = pd.DataFrame({"student": df_final["student"], "class_group": df_final["class_group"]})
+    run.set(version=version, group=group, _full_df=events, _full_df_filt=events)
+    part = qd.GroupPartition.of(events)
+    # Inline artifact of the group selection, next to the `group` input of group_results
+    qd.derived("group_frames", lambda: (part.select(events, group), part.select(events, group)),
+               version=version, group=group)
+    adj_bareme = pd.DataFrame({"AvgScore": [0.5, 0.5], "Coefficient": list(coeffs)}, index=["q1", "q2"]).T
+    run.set(_df_final=df_final)
+    run.get("group_results")
+    run.set(adj_bareme=adj_bareme, questions=["q1", "q2"], exam_title="", _quiz=None, seuil=0.0,
+            final_weights=WEIGHTS, maxtries=3)
+    run.set(coeffs=adj_bareme.loc["Coefficient"], scale="20")
+    return run
+
+
+def test_regrade_group():
+    df_final = results()
+    run = regrade(df_final, "G2")
+    scores = run.get("scores")
+    expected = df_final[df_final["class_group"] == "G2"]
+    assert scores["student"].tolist() == expected["student"].tolist()
+    np.testing.assert_allclose(scores["FinalMark"], (expected["q1"] + 2 * expected["q2"]) * 20 / 3)
+    np.testing.assert_allclose(run.get("final_marks"), (df_final["q1"] + 2 * df_final["q2"]) * 20 / 3)
+
+
+def test_name_clash_rejected():
+    run = regrade(results(), "All")
+    with pytest.raises(ValueError):
+        run.derive("group", lambda: None)
+    with pytest.raises(ValueError):
+        run.set(scores=None)
+
+
+def test_identity_inputs_not_kept():
+    flow = Dataflow(maxbytes=10**6)
+    frame = pd.DataFrame({"a": np.arange(10)})
+    flow.run({}).derive("total", lambda: int(frame["a"].sum()), _frame=frame)
+    entry = next(iter(flow.cache._data.values()))[0]
+    del frame
+    assert entry[1][0]() is None
@@ -0,0 +1,78 @@
+"""
+Tests of the shared poller of an event log (poller.py) when the source fails.
+Run with: python -m pytest tests
+"""
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "benchmarks"))
+sys.path.insert(0, str(HERE.parent / "src" / "quiz_dash"))
+
+import synthetic
+from ingest import IncrementalEventLog
+from poller import LogPoller
+
+
+class FailingSource:
+    """Source which serves a sheet, then raises once `fail` is set."""
+
+    key = "failing"
+
+    def __init__(self, data):
+        self.data = data
+        self.fail = False
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        if self.fail:
+            raise ConnectionError("sheet unreachable")
+        return self.data
+
+
+def make_poller():
+    df, _ = synthetic.make_events(synthetic.make_quiz_bank(5), 10)
+    source = FailingSource(synthetic.to_raw_csv(df))
+    return source, LogPoller(IncrementalEventLog(source), retry_delay=60)
+
+
+def test_failed_fetch_recorded():
+    source, poller = make_poller()
+    df, _ = poller.read()
+    fetched_at = poller.snapshot.fetched_at
+    assert df is not None and poller.error is None
+    source.fail = True
+    df_stale, _ = poller.read(max_age=0)
+    # The last snapshot is kept, and the failure is recorded on the poller
+    assert df_stale is df
+    assert poller.snapshot.fetched_at == fetched_at
+    assert isinstance(poller.error, ConnectionError)
+    assert poller.failures == 1 and poller.failed_at is not None
+
+
+def test_failed_fetch_backoff():
+    source, poller = make_poller()
+    poller.read()
+    source.fail = True
+    poller.read(max_age=0)
+    fetches = source.fetches
+    # Within the retry delay, an expired snapshot is not fetched again
+    for _ in range(5):
+        poller.read(max_age=0)
+    assert source.fetches == fetches
+    # Once the delay has passed, the source is retried and the error cleared when it answers
+    source.fail = False
+    poller.failed_at = time.time() - 60
+    df, _ = poller.read(max_age=0)
+    assert source.fetches == fetches + 1
+    assert df is not None and poller.error is None and poller.failures == 0
+
+
+def test_source_never_read():
+    source, poller = make_poller()
+    source.fail = True
+    assert poller.read() == (None, None)
+    assert poller.read() == (None, None)
+    assert source.fetches == 1